@@ -0,0 +1,200 @@
+"""
+Admission control for upstream LLM calls.
+
+At most ADMISSION_MAX_CONCURRENT upstream calls run at once per worker, and
+one user may hold at most ADMISSION_MAX_PER_USER of them. Everyone else waits
+in a per-user FIFO; when a slot frees up, users are served round-robin so a
+burst of requests from one user cannot starve the others. A request that
+waits longer than ADMISSION_QUEUE_TIMEOUT, or arrives when
+ADMISSION_MAX_QUEUE requests are already waiting, is rejected with
+AdmissionRejected, which the routes turn into 429 + Retry-After.
+
+With ADMISSION_LOAD_SHEDDING, `under_pressure()` tells the routes to
+downgrade expensive modes (deep/thinking) to standard while requests are
+queueing.
+"""
+import os
+import threading
+import time
+from collections import deque, OrderedDict
+
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "8"))
+ADMISSION_MAX_PER_USER = int(os.getenv("ADMISSION_MAX_PER_USER", "2"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "20"))
+ADMISSION_LOAD_SHEDDING = os.getenv("ADMISSION_LOAD_SHEDDING", "false").lower() == "true"
+# Queued requests at which load shedding kicks in
+ADMISSION_SHED_QUEUE_DEPTH = int(os.getenv("ADMISSION_SHED_QUEUE_DEPTH", "1"))
+SHED_MODES = {"deep", "thinking"}
+WAIT_WINDOW = 500
+
+
+class AdmissionRejected(Exception):
+    status = 429
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A granted (or pending) upstream slot; release it exactly once, or use as a context manager"""
+
+    def __init__(self, controller, user_key):
+        self.controller = controller
+        self.user_key = user_key
+        self.granted = False
+        self.released = False
+        self.enqueued_at = time.monotonic()
+        self.granted_at = None
+
+    def release(self):
+        self.controller.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=ADMISSION_MAX_CONCURRENT, max_per_user=ADMISSION_MAX_PER_USER,
+                 max_queue=ADMISSION_MAX_QUEUE, queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+                 load_shedding=ADMISSION_LOAD_SHEDDING, shed_queue_depth=ADMISSION_SHED_QUEUE_DEPTH):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.load_shedding = load_shedding
+        self.shed_queue_depth = shed_queue_depth
+        self._cond = threading.Condition()
+        self._active = 0
+        self._active_by_user = {}
+        self._queues = OrderedDict()
+        self._queued = 0
+        self._waits = deque(maxlen=WAIT_WINDOW)
+        self._service = deque(maxlen=WAIT_WINDOW)
+        self._counters = {"admitted": 0, "queued": 0, "rejectedQueueFull": 0, "rejectedTimeout": 0, "shed": 0}
+
+    def _can_run(self, user_key):
+        return self._active < self.max_concurrent and self._active_by_user.get(user_key, 0) < self.max_per_user
+
+    def _grant(self, ticket):
+        ticket.granted = True
+        ticket.granted_at = time.monotonic()
+        self._active += 1
+        self._active_by_user[ticket.user_key] = self._active_by_user.get(ticket.user_key, 0) + 1
+        self._waits.append(ticket.granted_at - ticket.enqueued_at)
+        self._counters["admitted"] += 1
+
+    def _dispatch(self):
+        """Hand free slots to waiting users round-robin; called with the lock held"""
+        granted = False
+        for user_key in list(self._queues):
+            if self._active >= self.max_concurrent:
+                break
+            if not self._can_run(user_key):
+                continue
+            queue = self._queues.pop(user_key)
+            self._grant(queue.popleft())
+            self._queued -= 1
+            granted = True
+            if queue:
+                # Back of the line for this user's next request
+                self._queues[user_key] = queue
+        if granted:
+            self._cond.notify_all()
+
+    def _retry_after(self):
+        service = sorted(self._service)
+        typical = service[len(service) // 2] if service else 5.0
+        return max(1, int(typical * (self._queued + 1) / self.max_concurrent + 0.5))
+
+    def acquire(self, user_key, timeout=None, background=False):
+        """
+        Wait for an upstream slot; raises AdmissionRejected on a full queue or timeout.
+        Background callers (jobs) wait for room in a full queue instead of being rejected at once.
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        ticket = Ticket(self, user_key)
+        deadline = ticket.enqueued_at + timeout
+        with self._cond:
+            if not self._queues and self._can_run(user_key):
+                self._grant(ticket)
+                return ticket
+            while self._queued >= self.max_queue:
+                remaining = deadline - time.monotonic()
+                if not background or remaining <= 0:
+                    self._counters["rejectedQueueFull"] += 1
+                    raise AdmissionRejected("Too many requests are waiting, please try again shortly.", self._retry_after())
+                self._cond.wait(remaining)
+            if not self._queues and self._can_run(user_key):
+                self._grant(ticket)
+                return ticket
+
+            self._queues.setdefault(user_key, deque()).append(ticket)
+            self._queued += 1
+            self._counters["queued"] += 1
+            self._dispatch()
+
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queues[user_key].remove(ticket)
+                    if not self._queues[user_key]:
+                        del self._queues[user_key]
+                    self._queued -= 1
+                    self._counters["rejectedTimeout"] += 1
+                    # Background callers may be waiting for room in the queue
+                    self._cond.notify_all()
+                    raise AdmissionRejected("The AI service is busy, please try again shortly.", self._retry_after())
+                self._cond.wait(remaining)
+        return ticket
+
+    def release(self, ticket):
+        with self._cond:
+            if ticket.released or not ticket.granted:
+                return
+            ticket.released = True
+            self._service.append(time.monotonic() - ticket.granted_at)
+            self._active -= 1
+            remaining = self._active_by_user.get(ticket.user_key, 1) - 1
+            if remaining:
+                self._active_by_user[ticket.user_key] = remaining
+            else:
+                self._active_by_user.pop(ticket.user_key, None)
+            self._dispatch()
+
+    def under_pressure(self):
+        return self._queued >= self.shed_queue_depth
+
+    def shed_mode(self, mode):
+        """Downgrade deep/thinking to standard while requests are queueing (if load shedding is on)"""
+        if self.load_shedding and mode in SHED_MODES and self.under_pressure():
+            with self._cond:
+                self._counters["shed"] += 1
+            print(f"DEBUG: Load shedding - {mode} request downgraded to standard")
+            return "standard"
+        return mode
+
+    def stats(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            report = {
+                **self._counters,
+                "active": self._active,
+                "queueDepth": self._queued,
+                "waitingUsers": len(self._queues),
+                "maxConcurrent": self.max_concurrent,
+                "maxPerUser": self.max_per_user,
+                "loadShedding": self.load_shedding
+            }
+        if waits:
+            report["waitMs"] = {
+                "p50": round(waits[len(waits) // 2] * 1000, 1),
+                "p95": round(waits[min(int(len(waits) * 0.95), len(waits) - 1)] * 1000, 1),
+                "max": round(waits[-1] * 1000, 1)
+            }
+        return report
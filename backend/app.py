@@ -1,21 +1,49 @@
 import os
+import json
+import time
+import threading
 import requests
 from datetime import datetime, timedelta, timezone
-from functools import wraps
+from functools import partial, wraps
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from flask_caching import Cache
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
 from dotenv import load_dotenv
 from bson.objectid import ObjectId
 import certifi
 
 from werkzeug.security import generate_password_hash, check_password_hash
-import PyPDF2
-from io import BytesIO
 
 from prompts_engine import get_specialized_prompt
+from prompt_fragments import registry as prompt_fragments
+import greetings
+from greetings import greeting_reply
+import model_router
+from model_router import choose_model, timed, record_latency, LARGE_MODEL, FALLBACK_MODELS
+from llm_client import get_llm_client
+from upstream import ResilientUpstream, UpstreamError
+from hedging import Hedger
+from admission import AdmissionController, AdmissionRejected
+from jobs import JobRunner, job_payload, JOB_QUEUE_TIMEOUT
+from user_resolver import UserResolver
+from db_indexes import ensure_indexes, MONGO_ENSURE_INDEXES
+from write_behind import WriteBehind
+import rollups
+from cache_keys import generation_cache_key
+from singleflight import SingleFlight
+from semantic_cache import SemanticCache, SEMANTIC_CACHE_ENABLED
+from pdf_store import ingest_pdf, get_pdf_document, PdfDocumentError
+from retrieval import retrieve_context
+from map_reduce import condense_document, needs_condensing, WHOLE_DOCUMENT_TYPES
+import text_extraction
+from text_extraction import describe_timings
+import uploads
+from uploads import SpooledUpload, PeakMemory, UploadRejected, MAX_UPLOAD_BYTES
+import token_budget
+from token_budget import plan_request, token_report, usage_from, truncate_to_tokens, file_context_tokens, chars_for_tokens
 
 # =============================
 # CONFIG
@@ -55,37 +83,55 @@ cors_config = {
 
 CORS(app, resources={r"/api/*": cors_config})
 
+# Reject oversized request bodies before they are read (1 MB headroom for the other form fields)
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES + 1024 * 1024
+
+@app.errorhandler(413)
+def request_too_large(error):
+    # Werkzeug's default is an HTML page - the frontend expects JSON errors
+    return jsonify({"error": f"File is larger than the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit"}), 413
+
 # =============================
 # CACHING CONFIG
 # =============================
+# "sqlite" shares one on-disk cache between all workers and survives restarts,
+# "simple" falls back to a per-worker in-memory dict
+CACHE_BACKENDS = {
+    "sqlite": "response_cache.SQLiteCache",
+    "simple": "SimpleCache"
+}
 cache_config = {
     "DEBUG": True,          # some Flask-Caching versions need this
-    "CACHE_TYPE": "SimpleCache", # In-memory cache
-    "CACHE_DEFAULT_TIMEOUT": 600 # 10 minutes
+    "CACHE_TYPE": CACHE_BACKENDS.get(os.getenv("RESPONSE_CACHE_BACKEND", "sqlite"), "response_cache.SQLiteCache"),
+    "CACHE_DEFAULT_TIMEOUT": 600, # 10 minutes
+    "CACHE_THRESHOLD": int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000")),
+    "CACHE_SQLITE_MAX_BYTES": int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+    "CACHE_SQLITE_PATH": os.getenv("RESPONSE_CACHE_PATH", os.path.join(os.path.dirname(__file__), "cache", "response_cache.sqlite3"))
 }
 app.config.from_mapping(cache_config)
 cache = Cache(app)
+GENERATION_CACHE_TIMEOUT = 600
 
-def make_cache_key():
-    """Custom cache key for POST requests with JSON body"""
-    if request.method == 'POST':
-        try:
-            data = request.get_json(silent=True) or request.form
-            # Create a unique key based on topic, content_type, and academic_year
-            key_parts = [
-                str(data.get('topic', '')),
-                str(data.get('content_type', 'Explanation')),
-                str(data.get('academic_year', '1st')),
-                str(data.get('mode', 'standard'))
-            ]
-            return ":".join(key_parts)
-        except:
-            return request.url
-    return request.url
+# Coalesces identical in-flight generations (keyed by cache key) within this worker
+inflight = SingleFlight()
+# How long a coalesced request waits for the identical request it joined
+INFLIGHT_WAIT_TIMEOUT = float(os.getenv("INFLIGHT_WAIT_TIMEOUT", "300"))
+
+# Answers near-duplicate topics ("explain ohms law" vs "Ohm's Law explanation")
+semantic_cache = SemanticCache()
+# Retries, circuit breaking and model fallback for every upstream call
+upstream = ResilientUpstream(lambda: get_llm_client(GROQ_API_KEY, sdk_retries=False), fallbacks=FALLBACK_MODELS)
+# Optional second request when the first token is slow (HEDGE_ENABLED)
+hedger = Hedger()
+# Bounded, per-user fair concurrency for upstream calls (429 when the queue wait runs out)
+admission = AdmissionController()
 
 # =============================
 # MONGODB CONNECTION
 # =============================
+# Stays None if the client cannot even be built (e.g. a malformed MONGO_URI); the app still
+# starts and requests that need the database fail one by one
+db = None
 try:
     client = MongoClient(
         MONGO_URI,
@@ -96,9 +142,19 @@ try:
     db = client["eduwrite"]
     client.admin.command("ping")
     print("SUCCESS: MongoDB connected successfully")
+    if MONGO_ENSURE_INDEXES:
+        ensure_indexes(db)
 except Exception as e:
     print(f"ERROR: MongoDB connection error: {e}")
 
+# id/email -> user lookups, cached in-process for returning users
+user_resolver = UserResolver(db, on_create=lambda created_at: rollups.record_new_user(db, created_at))
+# Batched, asynchronous inserts for history and logins (journaled to disk while Mongo is down);
+# each flush also updates the daily analytics rollups
+write_behind = WriteBehind(db, on_write=lambda events: rollups.apply_events(db, events))
+# Background worker pool for POST /api/jobs, results kept in db.jobs
+jobs = JobRunner(db)
+
 # Prompt loading is now handled by prompts_engine.py
 
 
@@ -142,13 +198,14 @@ def email_auth():
             # If user exists but has no password, they might have been a legacy/google user
             # We can allow them to set a password on first email login or handle appropriately
             db.users.update_one({"_id": user["_id"]}, {"$set": {"password": generate_password_hash(password)}})
+            user_resolver.invalidate(user)
         else:
             return jsonify({"error": "Invalid password"}), 401
     
     user_id = user["_id"]
     
     # Record Login for stats
-    db.logins.insert_one({"user_id": str(user_id), "email": email, "timestamp": now, "type": "login"})
+    write_behind.add("logins", {"user_id": str(user_id), "email": email, "timestamp": now, "type": "login"})
 
     return jsonify({
         "status": "success",
@@ -169,25 +226,274 @@ def signup():
         return jsonify({"error": "User already exists with this email"}), 400
         
     now = datetime.now(timezone.utc)
-    user_id = db.users.insert_one({
-        "username": name,
-        "email": email,
-        "password": generate_password_hash(password),
-        "created_at": now,
-        "credits_last_reset": now,
-        "last_login": now
-    }).inserted_id
+    try:
+        user_id = db.users.insert_one({
+            "username": name,
+            "email": email,
+            "password": generate_password_hash(password),
+            "created_at": now,
+            "credits_last_reset": now,
+            "last_login": now
+        }).inserted_id
+    except DuplicateKeyError:
+        # Concurrent signup with the same email (users.email is unique)
+        return jsonify({"error": "User already exists with this email"}), 400
+    user_resolver.invalidate(email=email)
+    rollups.record_new_user(db, now)
     
     # Record Login for stats
-    db.logins.insert_one({"user_id": str(user_id), "email": email, "timestamp": now, "type": "signup"})
+    write_behind.add("logins", {"user_id": str(user_id), "email": email, "timestamp": now, "type": "signup"})
 
     return jsonify({
         "status": "success",
         "user": {"id": str(user_id), "email": email, "name": name}
     }), 201
 
+# =============================
+# GENERATION HELPERS
+# =============================
+# GROQ_MODEL; model_router picks a smaller model for telescope mode and short content types
+DEFAULT_MODEL = LARGE_MODEL
+
+# AI Parameters based on Mode (completion budgets come from token_budget)
+MODE_SETTINGS = {
+    "standard": {"temperature": 0.2, "instruction": ""},
+    "telescope": {
+        "temperature": 0.1,
+        "instruction": "Be extremely concise, brief, and to the point. Minimal tokens used."
+    },
+    "deep": {
+        "temperature": 0.3,
+        "instruction": "Provide a very detailed, multi-step, and structured response with deep reasoning."
+    },
+    "thinking": {
+        "temperature": 0.4,
+        "instruction": "Process this using chain-of-thought reasoning. Think through the problem out loud before providing the final answer."
+    }
+}
+
+def extract_upload_text(file, content_type, mode):
+    """
+    Return (extracted_text, filename, file_sha256) for an uploaded PDF/TXT file.
+    PDF extraction stops once the mode's file-context token budget is covered,
+    unless the content type needs the whole file.
+    Raises UploadRejected when the upload breaks the size or page limits.
+    """
+    if not file:
+        return "", "", ""
+
+    extracted_text = ""
+    filename = ""
+    file_sha256 = ""
+    try:
+        filename = file.filename.lower()
+        with PeakMemory() as memory, SpooledUpload(file) as upload:
+            file_sha256 = upload.sha256
+            if filename.endswith('.pdf'):
+                char_budget = None if content_type in WHOLE_DOCUMENT_TYPES else chars_for_tokens(file_context_tokens(mode))
+                extraction = upload.extract_pdf(char_budget=char_budget)
+                extracted_text = extraction["text"]
+                print(f"DEBUG: Extracted {filename}: {describe_timings(extraction)}")
+            elif filename.endswith('.txt'):
+                extracted_text = upload.read_bytes().decode('utf-8')
+        print(f"DEBUG: Upload {filename}: {upload.stats()} memory: {memory.stats()}")
+    except UploadRejected:
+        raise
+    except Exception as fe:
+        print(f"File Process Error: {fe}")
+    return extracted_text, filename, file_sha256
+
+def with_file_context(topic, file_text, filename, content_type, mode, user_key, background=False):
+    """
+    Prefix the user's question with text extracted from the uploaded file.
+    Summaries and formula sheets of large files get map-reduce notes over the whole file
+    instead of its first few thousand tokens; those upstream calls are admitted as `user_key`.
+    """
+    if not file_text:
+        return topic
+
+    if needs_condensing(file_text, content_type):
+        context, report = condense_document(file_text, partial(complete_chat, user_key=user_key, background=background), cache, DEFAULT_MODEL)
+        print(f"DEBUG: Condensed {filename} for {content_type}: {report}")
+    else:
+        context = truncate_to_tokens(file_text, file_context_tokens(mode))
+    return f"Context from uploaded file ({filename}):\n{context}\n\nUser Question: {topic}"
+
+def resolve_generation_user(user_id_raw):
+    """Find the user by id or email, creating email-only users on first use"""
+    return user_resolver.resolve(user_id_raw, create=True)
+
+def admit(user_key, background=False):
+    """Admission ticket for one upstream call; background jobs may wait much longer than requests"""
+    if background:
+        return admission.acquire(user_key, timeout=JOB_QUEUE_TIMEOUT, background=True)
+    return admission.acquire(user_key)
+
+def complete_chat(messages, max_tokens, user_key, background=False, temperature=0.2, model=DEFAULT_MODEL):
+    """
+    Single non-streaming upstream call returning (text, model_used) - a fallback may answer.
+    The call waits for an admission slot as `user_key`, like every other upstream call.
+    """
+    with admit(user_key, background), timed(model):
+        completion, model_used = upstream.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=False
+        )
+    return completion.choices[0].message.content, model_used
+
+def build_llm_request(topic, content_type, academic_year, mode):
+    """
+    Build the chat completion arguments for a generate request.
+    Returns (llm_request, token_plan); max_tokens is sized by token_budget for the content type and mode.
+    """
+    settings = MODE_SETTINGS.get(mode, MODE_SETTINGS["standard"])
+    sys_prompt = get_specialized_prompt(content_type, academic_year)
+
+    # Inject mode instructions into system prompt
+    if settings["instruction"]:
+        sys_prompt = f"{sys_prompt}\n\nSPECIAL MODE ({mode.upper()}): {settings['instruction']}"
+
+    messages = [
+        {"role": "system", "content": sys_prompt},
+        {"role": "user", "content": topic}
+    ]
+    plan = plan_request(messages, content_type, mode)
+    return {
+        "model": choose_model(mode, content_type),
+        "messages": messages,
+        "temperature": settings["temperature"],
+        "max_tokens": plan["max_tokens"]
+    }, plan
+
+def record_generation(user, data, content_type, content, had_file, mode, tokens=None):
+    if tokens:
+        print(f"DEBUG: Tokens for {content_type}/{mode}: {tokens}")
+    write_behind.add("history", {
+        "user_id": str(user["_id"]), 
+        "topic": data.get('topic'), 
+        "content_type": content_type,
+        "response": content, 
+        "created_at": datetime.now(timezone.utc),
+        "had_file": had_file,
+        "mode": mode,
+        "tokens": tokens
+    })
+
+def get_cached_generation(cache_key, bucket, topic, file_text):
+    """Exact cache hit first, then a near-duplicate topic (uploads only ever match exactly)"""
+    content = cache.get(cache_key)
+    if content is None and not file_text and SEMANTIC_CACHE_ENABLED:
+        content, score = semantic_cache.lookup(bucket, topic)
+        if content is not None:
+            print(f"DEBUG: Semantic cache hit ({score:.2f}) for: {topic[:50]}")
+    return content
+
+def store_generation(cache_key, bucket, topic, file_text, content, model_used):
+    # bucket ends with the requested model; a fallback answer is served but not cached under it
+    if model_used != bucket[-1]:
+        print(f"DEBUG: Not caching {model_used} fallback answer for {bucket[-1]}")
+        return
+    cache.set(cache_key, content, timeout=GENERATION_CACHE_TIMEOUT)
+    if not file_text and SEMANTIC_CACHE_ENABLED:
+        semantic_cache.add(bucket, topic, content)
+
+class ModelStream:
+    """An upstream stream that remembers which model (requested or fallback) is serving it"""
+
+    def __init__(self, stream, model):
+        self._stream = stream
+        self.model = model
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def close(self):
+        close = getattr(self._stream, "close", None)
+        if close:
+            close()
+
+def open_hedged_stream(llm_request):
+    """
+    Start a streaming completion, hedged with a second request if its first token is slow.
+    The returned stream's `model` is the model that actually answered.
+    """
+    return hedger.open_stream(llm_request["model"], lambda: ModelStream(*upstream.create(**llm_request, stream=True)))
+
+def collect_stream(stream):
+    """Drain a completion stream into (text, usage); the model is still on `stream.model`"""
+    parts = []
+    usage = None
+    try:
+        for chunk in stream:
+            usage = usage_from(chunk) or usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+    finally:
+        stream.close()
+    return "".join(parts), usage
+
+def upstream_error_response(error):
+    """JSON error for an unavailable upstream or a full admission queue, with Retry-After when known"""
+    response = jsonify({"error": str(error)})
+    response.status_code = error.status
+    if error.retry_after:
+        response.headers["Retry-After"] = str(int(error.retry_after + 0.5))
+    return response
+
+def sse_event(payload):
+    """Format a dict as a single Server-Sent Events message"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+def run_generation(user, data, topic, content_type, academic_year, mode, file_text, filename, file_sha256, had_file,
+                   background=False):
+    """
+    Produce (and record in history) the response for one generate request.
+    Shared by /api/generate and background jobs (background=True, longer admission wait);
+    raises UpstreamError/AdmissionRejected when the upstream is unavailable or the admission queue is full.
+    """
+    # Greetings are answered locally - no upstream call
+    reply = None if had_file else greeting_reply(topic)
+    if reply:
+        record_generation(user, data, content_type, reply, False, mode)
+        return reply
+
+    mode = admission.shed_mode(mode)
+    llm_request, plan = build_llm_request(with_file_context(topic, file_text, filename, content_type, mode, str(user["_id"]), background), content_type, academic_year, mode)
+    cache_key = generation_cache_key(llm_request, topic, file_sha256)
+    bucket = (content_type, academic_year, mode, llm_request["model"])
+    content = get_cached_generation(cache_key, bucket, topic, file_text)
+    tokens = token_report(plan)
+
+    if content is None:
+        def call_upstream():
+            # AI CALL
+            with admit(str(user["_id"]), background), timed(llm_request["model"]):
+                if hedger.enabled:
+                    # Hedging races first tokens, so the completion is streamed and collected
+                    stream = open_hedged_stream(llm_request)
+                    result, usage = collect_stream(stream)
+                    model_used = stream.model
+                else:
+                    completion, model_used = upstream.create(**llm_request, stream=False)
+                    result, usage = completion.choices[0].message.content, usage_from(completion)
+            store_generation(cache_key, bucket, topic, file_text, result, model_used)
+            return result, usage
+
+        # Identical concurrent requests share one upstream call
+        (content, usage), shared = inflight.do(cache_key, call_upstream, timeout=INFLIGHT_WAIT_TIMEOUT)
+        if shared:
+            print(f"DEBUG: Shared in-flight generation for {cache_key}")
+        else:
+            tokens = token_report(plan, usage)
+
+    record_generation(user, data, content_type, content, had_file, mode, tokens)
+    return content
+
 @app.route('/api/generate', methods=['POST'])
-@cache.cached(timeout=600, make_cache_key=make_cache_key)
 def generate():
     # Attempt to get data from multiple sources
     data = request.get_json(silent=True) or request.form
@@ -202,98 +508,304 @@ def generate():
     if not topic or not user_id_raw:
         return jsonify({"error": "Missing data"}), 400
 
-    extracted_text = ""
-    if file:
-        try:
-            filename = file.filename.lower()
-            if filename.endswith('.pdf'):
-                pdf_reader = PyPDF2.PdfReader(BytesIO(file.read()))
-                for page in pdf_reader.pages:
-                    extracted_text += page.extract_text() + "\n"
-            elif filename.endswith('.txt'):
-                extracted_text = file.read().decode('utf-8')
-            
-            if extracted_text:
-                topic = f"Context from uploaded file ({filename}):\n{extracted_text[:4000]}\n\nUser Question: {topic}"
-        except Exception as fe:
-            print(f"File Process Error: {fe}")
+    try:
+        file_text, filename, file_sha256 = extract_upload_text(file, content_type, mode)
+    except UploadRejected as ue:
+        return jsonify({"error": str(ue)}), 413
 
     try:
         # Resolve User
-        u_id = ObjectId(user_id_raw) if len(user_id_raw) == 24 and all(c in '0123456789abcdef' for c in user_id_raw.lower()) else None
-        user = db.users.find_one({"_id": u_id}) if u_id else db.users.find_one({"email": user_id_raw})
-        
+        user = resolve_generation_user(user_id_raw)
         if not user:
-            if "@" in str(user_id_raw):
-                db.users.insert_one({
-                    "username": str(user_id_raw).split("@")[0], "email": str(user_id_raw),
-                    "created_at": datetime.now(timezone.utc), "credits_last_reset": datetime.now(timezone.utc)
-                })
-                user = db.users.find_one({"email": user_id_raw})
-            else:
-                return jsonify({"error": "User not found."}), 404
-        # AI Parameters based on Mode
-        max_tokens = 8192
-        temperature = 0.2
-        model = "llama-3.3-70b-versatile"
-        mode_instruction = ""
-        
-        if mode == 'telescope':
-            max_tokens = 512
-            temperature = 0.1
-            mode_instruction = "Be extremely concise, brief, and to the point. Minimal tokens used."
-        elif mode == 'deep':
-            max_tokens = 8192
-            temperature = 0.3
-            mode_instruction = "Provide a very detailed, multi-step, and structured response with deep reasoning."
-        elif mode == 'thinking':
-            max_tokens = 8192
-            temperature = 0.4
-            mode_instruction = "Process this using chain-of-thought reasoning. Think through the problem out loud before providing the final answer."
+            return jsonify({"error": "User not found."}), 404
 
-        # AI CALL
-        from groq import Groq
-        groq_client = Groq(api_key=GROQ_API_KEY)
-        sys_prompt = get_specialized_prompt(content_type, academic_year)
-        
-        # Inject mode instructions into system prompt
-        if mode_instruction:
-            sys_prompt = f"{sys_prompt}\n\nSPECIAL MODE ({mode.upper()}): {mode_instruction}"
+        content = run_generation(user, data, topic, content_type, academic_year, mode,
+                                 file_text, filename, file_sha256, bool(file))
+        return jsonify({"content": content})
 
-        completion = groq_client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": sys_prompt},
-                {"role": "user", "content": topic}
-            ],
-            temperature=temperature,
-            max_tokens=max_tokens,
-            stream=False
-        )
-        
-        content = completion.choices[0].message.content
+    except (UpstreamError, AdmissionRejected) as ue:
+        print(f"Gen Error: {ue}")
+        return upstream_error_response(ue)
+    except Exception as e:
+        print(f"Gen Error: {e}")
+        return jsonify({"error": str(e)}), 500
 
-        db.history.insert_one({
-            "user_id": str(user["_id"]), 
-            "topic": data.get('topic'), 
+@app.route('/api/generate/stream', methods=['POST'])
+def generate_stream():
+    """
+    Streaming variant of /api/generate - forwards tokens as Server-Sent Events
+    and writes the assembled response to history once the stream finishes
+    """
+    data = request.get_json(silent=True) or request.form
+    file = request.files.get('file')
+
+    mode = data.get('mode', 'standard').lower()
+    topic = data.get('topic')
+    content_type = data.get('content_type', 'Explanation')
+    user_id_raw = data.get('user_id')
+    academic_year = data.get('academic_year', '1st')
+
+    if not topic or not user_id_raw:
+        return jsonify({"error": "Missing data"}), 400
+
+    try:
+        file_text, filename, file_sha256 = extract_upload_text(file, content_type, mode)
+    except UploadRejected as ue:
+        return jsonify({"error": str(ue)}), 413
+
+    try:
+        user = resolve_generation_user(user_id_raw)
+        if not user:
+            return jsonify({"error": "User not found."}), 404
+
+        # Greetings are answered locally - no upstream call
+        reply = None if file else greeting_reply(topic)
+        if reply:
+            record_generation(user, data, content_type, reply, False, mode)
+            return Response(
+                sse_event({"delta": reply}) + sse_event({"done": True}),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
+        mode = admission.shed_mode(mode)
+        llm_request, plan = build_llm_request(with_file_context(topic, file_text, filename, content_type, mode, str(user["_id"])), content_type, academic_year, mode)
+    except (UpstreamError, AdmissionRejected) as ue:
+        # Condensing a large upload makes upstream calls of its own
+        print(f"Stream Gen Error: {ue}")
+        return upstream_error_response(ue)
+    except Exception as e:
+        print(f"Stream Gen Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    cache_key = generation_cache_key(llm_request, topic, file_sha256)
+    bucket = (content_type, academic_year, mode, llm_request["model"])
+    had_file = bool(file)
+
+    # Queue for an upstream slot before the stream starts, so a full queue is still a real 429
+    cached = get_cached_generation(cache_key, bucket, topic, file_text)
+    ticket = None
+    if cached is None:
+        try:
+            ticket = admission.acquire(str(user["_id"]))
+        except AdmissionRejected as ar:
+            print(f"Stream Gen Error: {ar}")
+            return upstream_error_response(ar)
+
+    # Set when a disconnected leader hands its stream and slot to a thread that finishes it
+    handed_off = threading.Event()
+
+    def finish_abandoned(chunks, stream, call, parts, usage, started):
+        """Read the rest of a stream whose client left, for the followers waiting on it"""
+        try:
+            for chunk in chunks:
+                usage = usage_from(chunk) or usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+            content = "".join(parts)
+            record_latency(llm_request["model"], time.perf_counter() - started)
+            store_generation(cache_key, bucket, topic, file_text, content, stream.model)
+        except BaseException as e:
+            inflight.finish(cache_key, call, error=e)
+        else:
+            inflight.finish(cache_key, call, result=(content, usage))
+        finally:
+            stream.close()
+            ticket.release()
+
+    def event_stream():
+        stream = None
+        parts = []
+        usage = None
+        try:
+            if cached is not None:
+                record_generation(user, data, content_type, cached, had_file, mode, token_report(plan))
+                yield sse_event({"delta": cached})
+                yield sse_event({"done": True})
+                return
+
+            call, leader = inflight.join(cache_key)
+            if not leader:
+                # An identical request is already streaming - wait for its full result
+                ticket.release()
+                # Leaders on both endpoints share (text, usage)
+                content, _ = call.wait(INFLIGHT_WAIT_TIMEOUT)
+                record_generation(user, data, content_type, content, had_file, mode, token_report(plan))
+                yield sse_event({"delta": content})
+                yield sse_event({"done": True})
+                return
+
+            try:
+                started = time.perf_counter()
+                stream = open_hedged_stream(llm_request)
+                chunks = iter(stream)
+
+                for chunk in chunks:
+                    usage = usage_from(chunk) or usage
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        yield sse_event({"delta": delta})
+
+                content = "".join(parts)
+                record_latency(llm_request["model"], time.perf_counter() - started)
+                store_generation(cache_key, bucket, topic, file_text, content, stream.model)
+            except GeneratorExit:
+                if stream is None or not call.followers:
+                    inflight.finish(cache_key, call, error=RuntimeError("In-flight request was cancelled"))
+                    raise
+                # The client left, but identical requests are waiting on this answer - finish it for them
+                handed_off.set()
+                threading.Thread(target=finish_abandoned, args=(chunks, stream, call, parts, usage, started),
+                                 name="stream-handoff", daemon=True).start()
+                stream = None
+                raise
+            except BaseException as e:
+                inflight.finish(cache_key, call, error=e)
+                raise
+            inflight.finish(cache_key, call, result=(content, usage))
+
+            record_generation(user, data, content_type, content, had_file, mode, token_report(plan, usage))
+            yield sse_event({"done": True})
+        except Exception as e:
+            print(f"Stream Gen Error: {e}")
+            yield sse_event({"error": str(e)})
+        finally:
+            # Client disconnects land here too - release the upstream connection
+            if stream is not None:
+                stream.close()
+            if ticket is not None and not handed_off.is_set():
+                ticket.release()
+
+    def release_ticket():
+        if not handed_off.is_set():
+            ticket.release()
+
+    response = Response(
+        stream_with_context(event_stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    if ticket is not None:
+        # Also frees the slot if the client goes away before the stream is ever iterated
+        response.call_on_close(release_ticket)
+    return response
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_generation_job():
+    """
+    Job mode of /api/generate for long generations (Project Documentation, Research Paper,
+    deep/thinking): returns 202 with a job id at once and runs the generation in the background.
+    Resubmitting an identical request while it is still running returns the same job.
+    """
+    data = request.get_json(silent=True) or request.form
+    file = request.files.get('file')
+
+    mode = data.get('mode', 'standard').lower()
+    topic = data.get('topic')
+    content_type = data.get('content_type', 'Explanation')
+    user_id_raw = data.get('user_id')
+    academic_year = data.get('academic_year', '1st')
+
+    if not topic or not user_id_raw:
+        return jsonify({"error": "Missing data"}), 400
+
+    try:
+        # The upload is read now - the request body is gone once the job runs
+        file_text, filename, file_sha256 = extract_upload_text(file, content_type, mode)
+    except UploadRejected as ue:
+        return jsonify({"error": str(ue)}), 413
+
+    try:
+        user = resolve_generation_user(user_id_raw)
+        if not user:
+            return jsonify({"error": "User not found."}), 404
+
+        had_file = bool(file)
+        params = {
+            "topic": topic,
             "content_type": content_type,
-            "response": content, 
-            "created_at": datetime.now(timezone.utc),
-            "had_file": bool(file),
-            "mode": mode
-        })
+            "mode": mode,
+            "academic_year": academic_year,
+            "file_sha256": file_sha256 or None
+        }
+        job, created = jobs.submit(str(user["_id"]), params, lambda: run_generation(
+            user, {"topic": topic}, topic, content_type, academic_year, mode,
+            file_text, filename, file_sha256, had_file, background=True
+        ))
+        if not created:
+            print(f"DEBUG: Resubmitted job {job['_id']} is still {job['status']}")
 
-        return jsonify({"content": content})
+        response = jsonify({"job_id": job["_id"], "status": job["status"]})
+        response.status_code = 202
+        response.headers["Location"] = f"/api/jobs/{job['_id']}"
+        return response
+    except Exception as e:
+        print(f"Job Submit Error: {e}")
+        return jsonify({"error": str(e)}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_generation_job(job_id):
+    """Status of a generation job; includes the content once it has succeeded"""
+    user_id_raw = request.args.get('user_id')
+    if not user_id_raw:
+        return jsonify({"error": "Missing user_id"}), 400
+
+    try:
+        user = user_resolver.resolve(user_id_raw)
+        job = jobs.get(job_id, str(user["_id"])) if user else None
+        if not job:
+            return jsonify({"error": "Job not found."}), 404
+        return jsonify(job_payload(job))
     except Exception as e:
-        print(f"Gen Error: {e}")
+        print(f"Job Status Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/pdf/upload', methods=['POST'])
+def pdf_upload():
+    """
+    Ingest a PDF once and return a document id.
+    Follow-up /api/pdf-chat questions pass the doc_id instead of re-uploading the file.
+    """
+    file = request.files.get('file')
+    user_id_raw = request.form.get('user_id')
+
+    if not file or not user_id_raw:
+        return jsonify({"error": "Missing file or user_id"}), 400
+    if not file.filename.lower().endswith('.pdf'):
+        return jsonify({"error": "Only PDF files are supported"}), 400
+
+    try:
+        user = resolve_generation_user(user_id_raw)
+        if not user:
+            return jsonify({"error": "User not found."}), 404
+
+        with PeakMemory() as memory, SpooledUpload(file) as upload:
+            doc, created = ingest_pdf(db, upload, str(user["_id"]))
+        print(f"DEBUG: Upload {file.filename}: {upload.stats()} memory: {memory.stats()}")
+    except UploadRejected as ue:
+        return jsonify({"error": str(ue)}), 413
+    except PdfDocumentError as de:
+        return jsonify({"error": str(de)}), 400
+    except Exception as fe:
+        print(f"PDF Upload Error: {fe}")
+        return jsonify({"error": f"Error processing PDF: {str(fe)}"}), 400
+
+    return jsonify({
+        "status": "success",
+        "doc_id": doc["_id"],
+        "filename": doc["filename"],
+        "page_count": doc["page_count"],
+        "char_count": doc["char_count"],
+        "upload": upload.stats()
+    }), 201 if created else 200
+
 @app.route('/api/pdf-chat', methods=['POST'])
 def pdf_chat():
     """
-    Handle PDF chat requests - extracts text from PDF and answers questions about it
-    Only available for Explanation content type
+    Handle PDF chat requests - answers questions about an uploaded PDF
+    Accepts either a previously ingested doc_id or the PDF file itself
     """
     try:
         data = request.form
@@ -302,55 +814,46 @@ def pdf_chat():
         question = data.get('question')
         user_id_raw = data.get('user_id')
         content_type = data.get('content_type', 'Explanation')
+        doc_id = data.get('doc_id')
         
-        if not file or not question or not user_id_raw:
+        if not (file or doc_id) or not question or not user_id_raw:
             return jsonify({"error": "Missing file, question, or user_id"}), 400
         
-        # Extract PDF text
-        print(f"DEBUG: Starting PDF extraction for {file.filename}")
-        extracted_text = ""
+        # Resolve User
+        user = resolve_generation_user(user_id_raw)
+        if not user:
+            return jsonify({"error": "User not found."}), 404
+        
+        # Load the stored document, ingesting the upload on first use
         try:
-            filename = file.filename.lower()
-            if filename.endswith('.pdf'):
-                pdf_reader = PyPDF2.PdfReader(BytesIO(file.read()))
-                for page in pdf_reader.pages:
-                    extracted_text += page.extract_text() + "\n"
-                    if len(extracted_text) > 10000:
-                        break
+            if doc_id:
+                doc = get_pdf_document(db, doc_id, str(user["_id"]))
+                if not doc:
+                    return jsonify({"error": "Document not found. Please upload the PDF again."}), 404
+            elif file.filename.lower().endswith('.pdf'):
+                print(f"DEBUG: Starting PDF extraction for {file.filename}")
+                with SpooledUpload(file) as upload:
+                    doc, _ = ingest_pdf(db, upload, str(user["_id"]))
             else:
                 return jsonify({"error": "Only PDF files are supported"}), 400
-            
-            if not extracted_text:
-                return jsonify({"error": "Could not extract text from PDF"}), 400
+        except UploadRejected as ue:
+            return jsonify({"error": str(ue)}), 413
+        except PdfDocumentError as de:
+            return jsonify({"error": str(de)}), 400
         except Exception as fe:
             print(f"PDF Extract Error: {fe}")
             return jsonify({"error": f"Error processing PDF: {str(fe)}"}), 400
         
-        # Resolve User
-        u_id = ObjectId(user_id_raw) if len(user_id_raw) == 24 and all(c in '0123456789abcdef' for c in user_id_raw.lower()) else None
-        user = db.users.find_one({"_id": u_id}) if u_id else db.users.find_one({"email": user_id_raw})
-        
-        if not user:
-            if "@" in str(user_id_raw):
-                db.users.insert_one({
-                    "username": str(user_id_raw).split("@")[0], 
-                    "email": str(user_id_raw),
-                    "created_at": datetime.now(timezone.utc), 
-                    "credits_last_reset": datetime.now(timezone.utc)
-                })
-                user = db.users.find_one({"email": user_id_raw})
-            else:
-                return jsonify({"error": "User not found."}), 404
-        
-        # Build prompt for PDF Q&A with Explanation context
-        prompt = f"""You are an educational assistant helping a student understand a document they've uploaded.
-        
-Document Content:
-{extracted_text[:8000]}
-
-Student's Question: {question}
-
-Please answer the student's question based on the document provided. Focus on explaining and clarifying the content to help them understand better."""
+        retrieval = None
+        condensed = None
+        if needs_condensing(doc["text"], content_type):
+            # Summaries and formula sheets need the whole document, condensed by map-reduce
+            context, condensed = condense_document(doc["text"], partial(complete_chat, user_key=str(user["_id"])), cache, DEFAULT_MODEL)
+            print(f"DEBUG: Condensed {doc['filename']} for {content_type}: {condensed}")
+        else:
+            # Only the chunks relevant to the question go upstream
+            context, retrieval = retrieve_context(doc, question)
+            print(f"DEBUG: Retrieved {len(retrieval['chunks'])}/{retrieval['total_chunks']} chunks in {retrieval['latency_ms']}ms, scores: {[c['score'] for c in retrieval['chunks']]}")
         
         # Build specialized system prompt
         system_prompt = f"You are an expert academic assistant specializing in {content_type}. Use the provided PDF context to answer the user's request accurately."
@@ -363,24 +866,28 @@ Please answer the student's question based on the document provided. Focus on ex
         
         # AI CALL
         print(f"DEBUG: Calling Groq for question: {question[:50]}... Type: {content_type}")
-        from groq import Groq
-        groq_client = Groq(api_key=GROQ_API_KEY)
         
-        completion = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"DOCUMENT CONTENT:\n{extracted_text[:9000]}\n\nUSER QUESTION: {question}"}
-            ],
-            temperature=0.3,
-            max_tokens=2048,
-            stream=False
-        )
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"DOCUMENT EXCERPTS:\n{context}\n\nUSER QUESTION: {question}"}
+        ]
+        plan = plan_request(messages, content_type)
+        model = choose_model("pdf", content_type)
+        with admission.acquire(str(user["_id"])), timed(model):
+            completion, _ = upstream.create(
+                model=model,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=plan["max_tokens"],
+                stream=False
+            )
         
         content = completion.choices[0].message.content
+        tokens = token_report(plan, usage_from(completion))
+        print(f"DEBUG: Tokens for pdf-chat {content_type}: {tokens}")
         
         # Save to history
-        db.history.insert_one({
+        write_behind.add("history", {
             "user_id": str(user["_id"]), 
             "topic": question,
             "content_type": content_type,
@@ -388,11 +895,16 @@ Please answer the student's question based on the document provided. Focus on ex
             "created_at": datetime.now(timezone.utc),
             "had_file": True,
             "mode": "pdf",
-            "pdf_name": file.filename
+            "pdf_name": doc["filename"],
+            "pdf_doc_id": doc["_id"],
+            "tokens": tokens
         })
         
-        return jsonify({"content": content})
+        return jsonify({"content": content, "doc_id": doc["_id"], "retrieval": retrieval, "map_reduce": condensed})
     
+    except (UpstreamError, AdmissionRejected) as ue:
+        print(f"PDF Chat Error: {ue}")
+        return upstream_error_response(ue)
     except Exception as e:
         print(f"PDF Chat Error: {e}")
         return jsonify({"error": str(e)}), 500
@@ -413,8 +925,7 @@ def handle_documents():
 
     try:
         # Resolve User
-        u_id = ObjectId(user_id_raw) if len(user_id_raw) == 24 and all(c in '0123456789abcdef' for c in user_id_raw.lower()) else None
-        user = db.users.find_one({"_id": u_id}) if u_id else db.users.find_one({"email": user_id_raw})
+        user = user_resolver.resolve(user_id_raw)
         if not user: return jsonify({"error": "User not found"}), 404
 
         if request.method == 'POST':
@@ -450,12 +961,15 @@ def get_history():
     
     try:
         # Resolve ID if email passed
-        u_id = ObjectId(user_id_raw) if len(user_id_raw) == 24 and all(c in '0123456789abcdef' for c in user_id_raw.lower()) else None
-        user = db.users.find_one({"_id": u_id}) if u_id else db.users.find_one({"email": user_id_raw})
+        user = user_resolver.resolve(user_id_raw)
         
         if not user: return jsonify({"status": "success", "history": []})
         
-        history = list(db.history.find({"user_id": str(user["_id"])}).sort("created_at", -1).limit(50))
+        # Generations still waiting in the write-behind queue come first
+        pending = write_behind.pending("history", user_id=str(user["_id"]))[::-1]
+        stored = list(db.history.find({"user_id": str(user["_id"])}).sort("created_at", -1).limit(50))
+        pending_ids = {item["_id"] for item in pending}
+        history = (pending + [item for item in stored if item["_id"] not in pending_ids])[:50]
         for item in history:
             item["id"] = str(item["_id"])
             del item["_id"]
@@ -464,277 +978,218 @@ def get_history():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/admin/stats', methods=['GET'])
-def admin_stats():
-    # Remove admin restriction
-    
-    # Get stats for the last 7 days
-    end_date = datetime.now(timezone.utc)
-    start_date = (end_date - timedelta(days=7)).replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    # Pipeline for daily total logins and unique users
-    pipeline = [
-        {"$match": {"timestamp": {"$gte": start_date}}},
-        {"$group": {
-            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
-            "totalLogins": {"$sum": 1},
-            "uniqueUsers": {"$addToSet": "$user_id"}
-        }},
-        {"$project": {
-            "day": "$_id",
-            "totalLogins": 1,
-            "uniqueUsers": {"$size": "$uniqueUsers"},
-            "_id": 0
-        }},
-        {"$sort": {"day": 1}}
-    ]
-    
-    stats = list(db.logins.aggregate(pipeline))
-    
-    # Fill in missing days with zeros if any
+# =============================
+# ADMIN ANALYTICS
+# =============================
+# Per-day counters come from db.daily_rollups (see rollups.py), not from scans of history/logins.
+# Each metric is built from already-loaded rollup documents, so /api/admin/dashboard can
+# compute all of them from one read while the individual endpoints keep working.
+
+# Fresh for DASHBOARD_TTL seconds, then served stale (and refreshed in the background) up to DASHBOARD_STALE
+DASHBOARD_TTL = int(os.getenv("ADMIN_DASHBOARD_TTL", "30"))
+DASHBOARD_STALE = int(os.getenv("ADMIN_DASHBOARD_STALE", "300"))
+
+def admin_start_date(days):
+    return (datetime.now(timezone.utc) - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def rollup_series(docs, days, value):
+    """[{date, value}] for each rollup day in the last `days` days where `value(rollup)` is non-zero"""
+    start = rollups.day_key(admin_start_date(days))
+    series = []
+    for r in docs:
+        v = value(r) if r["_id"] >= start else 0
+        if v:
+            series.append({"date": r["_id"], "value": v})
+    return series
+
+def daily_login_stats(docs):
+    # Daily total logins and unique users for the last 7 days, missing days as zeros
+    start_date = admin_start_date(7)
+    by_day = {r["_id"]: r for r in docs}
     daily_stats = []
     for i in range(8):
         current_day = (start_date + timedelta(days=i)).strftime("%Y-%m-%d")
-        day_data = next((item for item in stats if item["day"] == current_day), None)
-        if day_data:
-            daily_stats.append(day_data)
-        else:
-            daily_stats.append({"day": current_day, "totalLogins": 0, "uniqueUsers": 0})
-            
-    return jsonify({"daily_stats": daily_stats})
-
-# =============================
-# EXTENDED ADMIN ANALYTICS
-# =============================
+        day_data = by_day.get(current_day, {})
+        daily_stats.append({
+            "day": current_day,
+            "totalLogins": day_data.get("logins", 0),
+            "uniqueUsers": len(day_data.get("loginUsers", []))
+        })
+    return daily_stats
 
-@app.route('/api/admin/summary', methods=['GET'])
-def get_admin_summary(): # Renamed function
-    # Remove admin restriction
-    total_users = db.users.count_documents({})
-    
-    now = datetime.now(timezone.utc)
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    active_users_today = len(db.logins.distinct("user_id", {"timestamp": {"$gte": today_start}}))
-    
-    total_prompts = db.history.count_documents({})
-    
-    # Estimate tokens: ~1.3 tokens per word approx
-    pipeline = [
-        {"$group": {
-            "_id": None,
-            "total_chars": {"$sum": {"$strLenCP": "$response"}}
-        }}
-    ]
-    res = list(db.history.aggregate(pipeline))
-    total_chars = res[0]["total_chars"] if res else 0
-    total_tokens = int(total_chars / 4) # Very rough estimate: 1 token ~= 4 chars
+def summary_stats(totals, docs):
+    today = next((r for r in docs if r["_id"] == rollups.day_key(datetime.now(timezone.utc))), {})
+    total_prompts = sum(r.get("prompts", 0) for r in totals)
+    total_tokens = sum(r.get("tokens", 0) for r in totals)
     est_cost = (total_tokens / 1000) * 0.0001 # $0.0001 per 1k tokens
-    
-    return jsonify({
-        "totalUsers": total_users,
-        "activeUsersToday": active_users_today,
+    return {
+        "totalUsers": db.users.estimated_document_count(),
+        "activeUsersToday": len(today.get("loginUsers", [])),
         "totalPrompts": total_prompts,
         "totalApiCalls": total_prompts, # Same as prompts for now
         "totalTokens": total_tokens,
         "estimatedCost": round(est_cost, 4)
-    })
+    }
+
+def feature_usage(totals):
+    counts = {}
+    for r in totals:
+        for name, count in r.get("features", {}).items():
+            counts[name] = counts.get(name, 0) + count
+    return [{"name": name, "value": count} for name, count in counts.items()]
+
+def token_usage(docs, days):
+    # Upstream-reported usage where recorded, else ~4 characters per token of the response
+    data = rollup_series(docs, days, lambda r: r.get("tokens", 0))
+    for item in data:
+        item["cost"] = round(item["value"] * 0.0000001, 4)
+    return data
+
+def stickiness(docs):
+    # DAU/MAU over the last 30 days, for each of the last 7 days
+    month_start = rollups.day_key(admin_start_date(30))
+    mau = len({u for r in docs if r["_id"] >= month_start for u in r.get("loginUsers", [])})
+    if mau == 0: mau = 1 # Avoid division by zero
+    return rollup_series(docs, 7, lambda r: len(r.get("loginUsers", [])) / mau * 100)
+
+def avg_prompts(docs, days):
+    return rollup_series(docs, days, lambda r: round(r.get("prompts", 0) / max(1, len(r.get("promptUsers", []))), 2))
+
+def sample_series(days, low, high):
+    # Placeholder metric until retention/latency/error tracking exists
+    import random
+    now = datetime.now()
+    return [{"date": (now - timedelta(days=days-1-i)).strftime("%Y-%m-%d"), "value": random.uniform(low, high)} for i in range(days)]
+
+def dashboard_data(days):
+    """Every admin dashboard metric from one rollup read (plus the all-time totals)"""
+    docs = rollups.days_since(db, admin_start_date(max(days, 30)))
+    totals = rollups.all_days(db, ["prompts", "tokens", "features"])
+    return {
+        "summary": summary_stats(totals, docs),
+        "daily": daily_login_stats(docs),
+        "dau": rollup_series(docs, days, lambda r: len(r.get("loginUsers", []))),
+        "newUsers": rollup_series(docs, days, lambda r: r.get("newUsers", 0)),
+        "prompts": rollup_series(docs, days, lambda r: r.get("prompts", 0)),
+        "tokens": token_usage(docs, days),
+        "features": feature_usage(totals),
+        "stickiness": stickiness(docs),
+        "retention": sample_series(days, 15, 45),
+        "responseTime": sample_series(days, 0.8, 2.5),
+        "errorRate": sample_series(days, 0.1, 1.5),
+        "avgPrompts": avg_prompts(docs, days),
+        "generatedAt": time.time()
+    }
+
+def refresh_dashboard(days):
+    cache_key = f"admin-dashboard:{days}"
+    def compute():
+        data = dashboard_data(days)
+        cache.set(cache_key, data, timeout=DASHBOARD_STALE)
+        return data
+    # Concurrent refreshes of the same range share one computation
+    return inflight.do(cache_key, compute)[0]
+
+@app.route('/api/admin/dashboard', methods=['GET'])
+def get_admin_dashboard():
+    """
+    All admin dashboard metrics in one response (replaces 12 separate /api/admin/* calls).
+    Cached with stale-while-revalidate: within DASHBOARD_TTL the cached copy is served as is,
+    after that it is still served while a background thread recomputes it. ?refresh=1 recomputes now.
+    """
+    # Remove admin restriction
+    days = int(request.args.get('days', 7))
+    cached = None if request.args.get('refresh') else cache.get(f"admin-dashboard:{days}")
+    if cached is None:
+        data = refresh_dashboard(days)
+    else:
+        data = cached
+        if time.time() - cached["generatedAt"] > DASHBOARD_TTL:
+            threading.Thread(target=refresh_dashboard, args=(days,), daemon=True).start()
+    response = jsonify(data)
+    response.headers["X-Dashboard-Age"] = str(int(time.time() - data["generatedAt"]))
+    return response
+
+@app.route('/api/admin/stats', methods=['GET'])
+def admin_stats():
+    # Remove admin restriction
+    return jsonify({"daily_stats": daily_login_stats(rollups.days_since(db, admin_start_date(7)))})
+
+@app.route('/api/admin/summary', methods=['GET'])
+def get_admin_summary(): # Renamed function
+    # Remove admin restriction
+    today = rollups.days_since(db, admin_start_date(0))
+    return jsonify(summary_stats(rollups.all_days(db, ["prompts", "tokens"]), today))
 
 @app.route('/api/admin/dau', methods=['GET'])
 def get_dau():
     # Remove admin restriction
     days = int(request.args.get('days', 7))
-    start_date = (datetime.now(timezone.utc) - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    pipeline = [
-        {"$match": {"timestamp": {"$gte": start_date}}},
-        {"$group": {
-            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
-            "uniqueUsers": {"$addToSet": "$user_id"}
-        }},
-        {"$project": {
-            "date": "$_id",
-            "value": {"$size": "$uniqueUsers"},
-            "_id": 0
-        }},
-        {"$sort": {"date": 1}}
-    ]
-    data = list(db.logins.aggregate(pipeline))
-    return jsonify(data)
+    return jsonify(rollup_series(rollups.days_since(db, admin_start_date(days)), days, lambda r: len(r.get("loginUsers", []))))
 
 @app.route('/api/admin/new-users', methods=['GET'])
 def get_new_users():
     # Remove admin restriction
     days = int(request.args.get('days', 7))
-    start_date = (datetime.now(timezone.utc) - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    pipeline = [
-        {"$match": {"created_at": {"$gte": start_date}}},
-        {"$group": {
-            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
-            "count": {"$sum": 1}
-        }},
-        {"$project": {
-            "date": "$_id",
-            "value": "$count",
-            "_id": 0
-        }},
-        {"$sort": {"date": 1}}
-    ]
-    data = list(db.users.aggregate(pipeline))
-    return jsonify(data)
+    return jsonify(rollup_series(rollups.days_since(db, admin_start_date(days), ["newUsers"]), days, lambda r: r.get("newUsers", 0)))
 
 @app.route('/api/admin/prompts-per-day', methods=['GET'])
 def get_prompts_per_day():
     # Remove admin restriction
     days = int(request.args.get('days', 7))
-    start_date = (datetime.now(timezone.utc) - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    pipeline = [
-        {"$match": {"created_at": {"$gte": start_date}}},
-        {"$group": {
-            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
-            "count": {"$sum": 1}
-        }},
-        {"$project": {
-            "date": "$_id",
-            "value": "$count",
-            "_id": 0
-        }},
-        {"$sort": {"date": 1}}
-    ]
-    data = list(db.history.aggregate(pipeline))
-    return jsonify(data)
+    return jsonify(rollup_series(rollups.days_since(db, admin_start_date(days), ["prompts"]), days, lambda r: r.get("prompts", 0)))
 
 @app.route('/api/admin/feature-usage', methods=['GET'])
 def get_feature_usage():
     # Remove admin restriction
-    pipeline = [
-        {"$group": {
-            "_id": "$content_type",
-            "count": {"$sum": 1}
-        }},
-        {"$project": {
-            "name": "$_id",
-            "value": "$count",
-            "_id": 0
-        }}
-    ]
-    data = list(db.history.aggregate(pipeline))
-    return jsonify(data)
+    return jsonify(feature_usage(rollups.all_days(db, ["features"])))
 
 @app.route('/api/admin/token-usage', methods=['GET'])
 def get_token_usage():
     # Remove admin restriction
     days = int(request.args.get('days', 7))
-    start_date = (datetime.now(timezone.utc) - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    pipeline = [
-        {"$match": {"created_at": {"$gte": start_date}}},
-        {"$project": {
-            "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
-            "tokens": {"$divide": [{"$strLenCP": "$response"}, 4]}
-        }},
-        {"$group": {
-            "_id": "$day",
-            "value": {"$sum": "$tokens"}
-        }},
-        {"$project": {
-            "date": "$_id",
-            "value": {"$round": ["$value", 0]},
-            "cost": {"$round": [{"$multiply": ["$value", 0.0000001]}, 4]},
-            "_id": 0
-        }},
-        {"$sort": {"date": 1}}
-    ]
-    data = list(db.history.aggregate(pipeline))
-    return jsonify(data)
+    return jsonify(token_usage(rollups.days_since(db, admin_start_date(days), ["tokens"]), days))
 
 @app.route('/api/admin/stickiness', methods=['GET'])
 def get_stickiness():
     # Remove admin restriction
-    # Calculate DAU/MAU for the last 30 days
-    now = datetime.now(timezone.utc)
-    start_date_mau = (now - timedelta(days=30)).replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    mau = len(db.logins.distinct("user_id", {"timestamp": {"$gte": start_date_mau}}))
-    if mau == 0: mau = 1 # Avoid division by zero
-    
-    # Get daily DAU for the last 7 days to show stickiness trend
-    start_date_dau = (now - timedelta(days=7)).replace(hour=0, minute=0, second=0, microsecond=0)
-    pipeline = [
-        {"$match": {"timestamp": {"$gte": start_date_dau}}},
-        {"$group": {
-            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
-            "dau": {"$addToSet": "$user_id"}
-        }},
-        {"$project": {
-            "date": "$_id",
-            "value": {"$multiply": [{"$divide": [{"$size": "$dau"}, mau]}, 100]},
-            "_id": 0
-        }},
-        {"$sort": {"date": 1}}
-    ]
-    data = list(db.logins.aggregate(pipeline))
-    return jsonify(data)
+    return jsonify(stickiness(rollups.days_since(db, admin_start_date(30), ["loginUsers"])))
 
 @app.route('/api/admin/avg-prompts', methods=['GET'])
 def get_avg_prompts():
     # Remove admin restriction
     days = int(request.args.get('days', 7))
-    start_date = (datetime.now(timezone.utc) - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    pipeline = [
-        {"$match": {"created_at": {"$gte": start_date}}},
-        {"$group": {
-            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
-            "prompts": {"$sum": 1},
-            "users": {"$addToSet": "$user_id"}
-        }},
-        {"$project": {
-            "date": "$_id",
-            "value": {"$round": [{"$divide": ["$prompts", {"$max": [1, {"$size": "$users"}]}]}, 2]},
-            "_id": 0
-        }},
-        {"$sort": {"date": 1}}
-    ]
-    data = list(db.history.aggregate(pipeline))
-    return jsonify(data)
+    return jsonify(avg_prompts(rollups.days_since(db, admin_start_date(days), ["prompts", "promptUsers"]), days))
 
 @app.route('/api/admin/retention', methods=['GET'])
 def get_retention():
     # Remove admin restriction
-    import random
     days = int(request.args.get('days', 7))
-    now = datetime.now()
-    data = []
-    for i in range(days):
-        d = (now - timedelta(days=days-1-i)).strftime("%Y-%m-%d")
-        data.append({"date": d, "value": random.uniform(15, 45)})
-    return jsonify(data)
+    return jsonify(sample_series(days, 15, 45))
 
 @app.route('/api/admin/response-time', methods=['GET'])
 def get_response_time():
     # Remove admin restriction
     days = int(request.args.get('days', 7))
-    now = datetime.now()
-    data = []
-    import random
-    for i in range(days):
-        d = (now - timedelta(days=days-1-i)).strftime("%Y-%m-%d")
-        data.append({"date": d, "value": random.uniform(0.8, 2.5)})
-    return jsonify(data)
+    return jsonify(sample_series(days, 0.8, 2.5))
 
 @app.route('/api/admin/error-rate', methods=['GET'])
 def get_error_rate():
     # Remove admin restriction
     days = int(request.args.get('days', 7))
-    now = datetime.now()
-    data = []
-    import random
-    for i in range(days):
-        d = (now - timedelta(days=days-1-i)).strftime("%Y-%m-%d")
-        data.append({"date": d, "value": random.uniform(0.1, 1.5)})
-    return jsonify(data)
+    return jsonify(sample_series(days, 0.1, 1.5))
+
+@app.route('/api/admin/cache-stats', methods=['GET'])
+def get_cache_stats():
+    backend = cache.cache
+    stats = backend.stats() if hasattr(backend, "stats") else {}
+    return jsonify({"backend": app.config["CACHE_TYPE"], **stats, "singleFlight": inflight.stats(), "semantic": semantic_cache.stats(),
+                    "promptFragments": prompt_fragments.stats(), "tokens": token_budget.stats(),
+                    "greetings": greetings.stats(), "models": model_router.stats(),
+                    "upstream": upstream.stats(), "hedging": hedger.stats(),
+                    "admission": admission.stats(), "jobs": jobs.stats(),
+                    "users": user_resolver.stats(), "writeBehind": write_behind.stats(),
+                    "uploads": uploads.stats()})
 
 @app.route('/api/history/clear', methods=['POST'])
 def clear_history():
@@ -742,6 +1197,8 @@ def clear_history():
     if not user_id_raw:
         return jsonify({"error": "User ID is required"}), 400
     try:
+        # Queued history would otherwise be written after the delete
+        write_behind.flush()
         # History is stored with string user_id, so we try both formats
         result = db.history.delete_many({"user_id": str(user_id_raw)})
         # Also try with ObjectId if needed
@@ -776,6 +1233,10 @@ def create_admin():
         print(f"[ERROR] Error creating admin: {e}")
 
 if __name__ == "__main__":
+    if text_extraction.PDF_EXTRACT_WORKERS > 1:
+        # Pool workers re-import __main__ - here that is this whole module, setup and all
+        print("WARNING: PDF_EXTRACT_WORKERS is ignored under `python app.py`; extracting sequentially")
+        text_extraction.PDF_EXTRACT_WORKERS = 1
     create_admin()
     print("[START] EduWrite Backend running on http://127.0.0.1:5001")
     app.run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,40 @@
+"""
+Content-addressed cache keys for LLM generations.
+
+A key is the SHA-256 of everything that determines the upstream answer: the
+normalized system prompt (mode instruction included), the normalized user
+question, a SHA-256 of the full extracted upload text, the model and the
+sampling parameters. Two different uploads can therefore never share an entry.
+"""
+import hashlib
+import json
+
+CACHE_KEY_VERSION = "v1"
+
+
+def normalize_prompt(text):
+    """Collapse runs of whitespace so formatting-only differences share a key"""
+    return " ".join(str(text or "").split())
+
+
+def generation_cache_key(llm_request, question, file_sha256=""):
+    """
+    Build the cache key for a chat completion request.
+    `question` is the raw user question (without file context prepended) and
+    `file_sha256` the SHA-256 of the uploaded file, if any. Hashing the raw bytes
+    lets extraction stop early without weakening the key.
+    """
+    system_prompt = next(
+        (m["content"] for m in llm_request["messages"] if m["role"] == "system"), ""
+    )
+    parts = {
+        "version": CACHE_KEY_VERSION,
+        "system": normalize_prompt(system_prompt),
+        "question": normalize_prompt(question),
+        "file_sha256": file_sha256 or "",
+        "model": llm_request["model"],
+        "temperature": llm_request["temperature"],
+        "max_tokens": llm_request["max_tokens"]
+    }
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"gen:{digest}"
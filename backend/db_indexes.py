@@ -0,0 +1,110 @@
+"""
+Index bootstrap and query-plan check for the eduwrite database.
+
+INDEXES declares every index the routes rely on. `ensure_indexes()` runs at
+app startup (disable with MONGO_ENSURE_INDEXES=false); create_index is a no-op
+for indexes that already exist, so this is cheap after the first run.
+
+HOT_QUERIES are the per-request and admin queries that must be served from an
+index. `check_query_plans()` explains each one and flags any plan containing a
+COLLSCAN stage. Run both from the command line:
+
+    python db_indexes.py            # create missing indexes
+    python db_indexes.py --check    # ... then explain the hot queries, exit 1 on COLLSCAN
+"""
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "true").lower() == "true"
+
+# (collection, keys, options)
+INDEXES = [
+    ("users", [("email", ASCENDING)], {"name": "email_unique", "unique": True}),
+    ("users", [("created_at", ASCENDING)], {"name": "created_at"}),
+    ("history", [("user_id", ASCENDING), ("created_at", DESCENDING)], {"name": "user_recent"}),
+    ("history", [("created_at", ASCENDING)], {"name": "created_at"}),
+    ("documents", [("user_id", ASCENDING), ("created_at", DESCENDING)], {"name": "user_recent"}),
+    ("logins", [("timestamp", ASCENDING), ("user_id", ASCENDING)], {"name": "timestamp_user"}),
+    ("jobs", [("user_id", ASCENDING), ("dedupe_key", ASCENDING), ("status", ASCENDING)], {"name": "user_dedupe_status"}),
+]
+
+
+def _hot_queries():
+    """(name, collection, filter, sort) for each query that has to use an index"""
+    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
+    return [
+        ("user by email", "users", {"email": "someone@example.com"}, None),
+        ("new users", "users", {"created_at": {"$gte": week_ago}}, None),
+        ("history page", "history", {"user_id": "0" * 24}, [("created_at", DESCENDING)]),
+        ("prompts per day", "history", {"created_at": {"$gte": week_ago}}, None),
+        ("documents list", "documents", {"user_id": "0" * 24}, [("created_at", DESCENDING)]),
+        ("logins range", "logins", {"timestamp": {"$gte": week_ago}}, None),
+        ("active job", "jobs", {"user_id": "0" * 24, "dedupe_key": "", "status": {"$in": ["queued", "running"]}}, None),
+    ]
+
+
+def ensure_indexes(db):
+    """Create any missing index; returns the names that failed (e.g. duplicate emails block the unique index)"""
+    failed = []
+    for collection, keys, options in INDEXES:
+        try:
+            db[collection].create_index(keys, **options)
+        except PyMongoError as e:
+            print(f"ERROR: Could not create index {collection}.{options['name']}: {e}")
+            failed.append(f"{collection}.{options['name']}")
+    return failed
+
+
+def plan_stages(plan):
+    """All stage names in an explain() plan tree (classic and slot-based engine layouts)"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for key in ("inputStage", "queryPlan", "winningPlan"):
+            stages.extend(plan_stages(plan.get(key)))
+        for child in plan.get("inputStages", []):
+            stages.extend(plan_stages(child))
+    return stages
+
+
+def check_query_plans(db):
+    """Explain every hot query; returns [(name, stages, ok)], ok is False for a COLLSCAN"""
+    results = []
+    for name, collection, query, sort in _hot_queries():
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = cursor.limit(50).explain()
+        stages = plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        results.append((name, stages, "COLLSCAN" not in stages))
+    return results
+
+
+def main(argv):
+    import certifi
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'), override=True)
+    client = MongoClient(os.getenv("MONGO_URI"), tls=True, tlsCAFile=certifi.where(), serverSelectionTimeoutMS=5000)
+    db = client["eduwrite"]
+
+    failed = ensure_indexes(db)
+    print(f"Indexes: {len(INDEXES) - len(failed)}/{len(INDEXES)} in place")
+    if "--check" not in argv:
+        return 1 if failed else 0
+
+    ok = True
+    for name, stages, indexed in check_query_plans(db):
+        print(f"{'OK  ' if indexed else 'FAIL'} {name}: {' <- '.join(stages)}")
+        ok = ok and indexed
+    return 0 if ok and not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
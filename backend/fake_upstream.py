@@ -0,0 +1,81 @@
+"""
+Local stand-in for the Groq client, for exercising upstream.py without network access.
+
+FakeUpstream exposes chat.completions.create like the real client and answers
+with a canned completion after an injected delay. Failures are injected either
+from a per-model script of outcomes (consumed one per call) or at random with
+`error_rate`. Outcomes are "ok", an HTTP status code (429, 500, 503, ...) or
+"connect" for a connection error.
+"""
+import random
+import threading
+import time
+import types
+from collections import defaultdict, deque
+
+import httpx
+
+
+class FakeStatusError(Exception):
+    """Mimics groq.APIStatusError: carries status_code and a response with headers"""
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = types.SimpleNamespace(status_code=status_code, headers=headers)
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+
+    def __iter__(self):
+        return self._chunks
+
+    def close(self):
+        pass
+
+
+class FakeUpstream:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, script=None,
+                 retry_after=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.scripts = defaultdict(deque, {model: deque(outcomes) for model, outcomes in (script or {}).items()})
+        self.calls = defaultdict(int)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    def _next_outcome(self, model):
+        with self._lock:
+            self.calls[model] += 1
+            if self.scripts[model]:
+                return self.scripts[model].popleft()
+            if self.error_rate and self._random.random() < self.error_rate:
+                return self.error_status
+            return "ok"
+
+    def create(self, model, messages, stream=False, **kwargs):
+        outcome = self._next_outcome(model)
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+
+        if outcome == "connect":
+            raise httpx.ConnectError("Injected connection failure")
+        if outcome != "ok":
+            raise FakeStatusError(outcome, self.retry_after if outcome == 429 else None)
+
+        text = f"[{model}] {messages[-1]['content'][:60]}"
+        usage = types.SimpleNamespace(prompt_tokens=10, completion_tokens=len(text.split()), total_tokens=10 + len(text.split()))
+        if stream:
+            return FakeStream([types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=text))])])
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=text))],
+            usage=usage
+        )
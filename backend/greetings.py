@@ -0,0 +1,94 @@
+"""
+Local fast path for greetings and casual check-ins.
+
+A bare "hi" or "how are you" used to cost a full upstream round-trip with the
+whole system prompt attached. Messages that exactly match one of the phrases
+in prompts/greetings_prompt.txt (after lower-casing and trimming punctuation)
+are answered locally with the reply configured in the same file. The file is
+read through the prompt fragment registry, so edits are picked up without a
+restart. Greetings that still reach the model ("hello!!", "hey there") are told
+to get the same reply through conversational_rules() in the system prompt.
+"""
+import ast
+import threading
+
+from prompt_fragments import registry as fragments
+
+GREETINGS_FRAGMENT = "greetings_prompt"
+
+DEFAULT_GREETINGS = (
+    "hi", "hello", "hey", "hi there", "hello there",
+    "how are you", "how r u", "who are you", "who r u"
+)
+DEFAULT_REPLY = "Hi! I am EduWrite, your educational AI assistant. What would you like to learn today?"
+
+_lock = threading.Lock()
+_config = {"version": None, "phrases": frozenset(DEFAULT_GREETINGS), "reply": DEFAULT_REPLY}
+_stats = {"checked": 0, "upstreamCallsAvoided": 0}
+
+
+def parse_greetings(source):
+    """
+    Read the `greetings = [...]` list and the "content" reply out of greetings_prompt.txt.
+    The file is a Python snippet; it is parsed, never executed.
+    """
+    phrases, reply = None, None
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "greetings" for t in node.targets):
+            phrases = ast.literal_eval(node.value)
+        elif isinstance(node, ast.Dict):
+            for key, value in zip(node.keys, node.values):
+                if isinstance(key, ast.Constant) and key.value == "content" and isinstance(value, ast.Constant):
+                    reply = value.value
+    return phrases, reply
+
+
+def _current_config():
+    version = fragments.current_version()
+    if _config["version"] == version:
+        return _config
+
+    with _lock:
+        if _config["version"] != version:
+            phrases, reply = DEFAULT_GREETINGS, DEFAULT_REPLY
+            source = fragments.raw(GREETINGS_FRAGMENT)
+            if source:
+                try:
+                    parsed_phrases, parsed_reply = parse_greetings(source)
+                    phrases = parsed_phrases or phrases
+                    reply = parsed_reply or reply
+                except (SyntaxError, ValueError) as e:
+                    print(f"WARNING: Could not parse {GREETINGS_FRAGMENT}, using defaults: {e}")
+            _config.update(version=version, phrases=frozenset(normalize(p) for p in phrases), reply=reply)
+    return _config
+
+
+def normalize(text):
+    return " ".join(str(text).lower().split()).strip("?!., ")
+
+
+def greeting_reply(message):
+    """The canned reply if `message` is a greeting or casual check-in, else None"""
+    config = _current_config()
+    answered = normalize(message) in config["phrases"]
+    with _lock:
+        _stats["checked"] += 1
+        if answered:
+            _stats["upstreamCallsAvoided"] += 1
+    return config["reply"] if answered else None
+
+
+def conversational_rules():
+    """System prompt block asking the model for the same greeting reply as the local fast path"""
+    reply = _current_config()["reply"]
+    return (
+        "CONVERSATIONAL RULES (ABSOLUTE PRIORITY):\n"
+        "- If the user's message is only a greeting or casual check-in (\"hi\", \"hello\", \"how are you\"), "
+        f"reply exactly: \"{reply}\"\n"
+        "- Do not generate academic or technical content for greetings."
+    )
+
+
+def stats():
+    with _lock:
+        return {**_stats, "phrases": len(_config["phrases"])}
@@ -0,0 +1,182 @@
+"""
+Hedged upstream requests.
+
+Tail latency of /api/generate is dominated by the occasional slow upstream
+completion. With HEDGE_ENABLED, a streaming request whose first chunk has not
+arrived within the HEDGE_PERCENTILE of recent time-to-first-token for that model
+gets a second, identical request. Whichever produces a first chunk first is
+used and the other stream is closed, which cancels it upstream. Hedges are
+capped at HEDGE_BUDGET extra calls per primary call, and no hedging happens
+until HEDGE_MIN_SAMPLES latencies have been seen.
+
+Metrics compare the time-to-first-token of the primary attempts (what every
+request would have waited without hedging) with what was actually served.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.05"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.25"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "500"))
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct), len(ordered) - 1)]
+
+
+class HedgedStream:
+    """The winning stream with its already-read first chunk put back in front"""
+
+    def __init__(self, stream, iterator, first):
+        self._stream = stream
+        self._iterator = iterator
+        self._first = first
+
+    @property
+    def model(self):
+        """The model serving the winning stream, when the opener recorded one"""
+        return getattr(self._stream, "model", None)
+
+    def __iter__(self):
+        if self._first is not None:
+            first, self._first = self._first, None
+            yield first
+        yield from self._iterator
+
+    def close(self):
+        close = getattr(self._stream, "close", None)
+        if close:
+            close()
+
+
+def _close_quietly(future):
+    if future.exception() is None:
+        stream = future.result()[0]
+        try:
+            getattr(stream, "close", lambda: None)()
+        except Exception:
+            pass
+
+
+class Hedger:
+    def __init__(self, enabled=HEDGE_ENABLED, percentile=HEDGE_PERCENTILE, budget=HEDGE_BUDGET,
+                 min_delay=HEDGE_MIN_DELAY, min_samples=HEDGE_MIN_SAMPLES, window=HEDGE_WINDOW):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window = window
+        self._lock = threading.Lock()
+        self._ttft = {}
+        self._served = deque(maxlen=window)
+        self._primary = deque(maxlen=window)
+        self._counters = {"requests": 0, "hedged": 0, "hedgeWins": 0, "budgetDenied": 0}
+
+    def hedge_delay(self, model):
+        """Seconds to wait for a first chunk before hedging, or None while there is too little history"""
+        with self._lock:
+            samples = list(self._ttft.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return max(self.min_delay, _percentile(samples, self.percentile))
+
+    def _take_budget(self):
+        with self._lock:
+            if self._counters["hedged"] + 1 > self.budget * self._counters["requests"]:
+                self._counters["budgetDenied"] += 1
+                return False
+            self._counters["hedged"] += 1
+            return True
+
+    def _record_ttft(self, model, seconds, primary):
+        with self._lock:
+            self._ttft.setdefault(model, deque(maxlen=self.window)).append(seconds)
+            if primary:
+                self._primary.append(seconds)
+
+    def _launch(self, model, open_stream, primary):
+        """Open a stream on its own thread and resolve with (stream, iterator, first_chunk)"""
+        future = Future()
+        started = time.perf_counter()
+
+        def run():
+            try:
+                stream = open_stream()
+                iterator = iter(stream)
+                first = next(iterator, None)
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            self._record_ttft(model, time.perf_counter() - started, primary)
+            future.set_result((stream, iterator, first))
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def open_stream(self, model, open_stream):
+        """
+        Return a stream for `model`, hedged when enabled.
+        `open_stream()` must start one upstream streaming request and return it.
+        """
+        if not self.enabled:
+            return open_stream()
+
+        with self._lock:
+            self._counters["requests"] += 1
+        started = time.perf_counter()
+        primary = self._launch(model, open_stream, primary=True)
+        attempts = [primary]
+
+        delay = self.hedge_delay(model)
+        if delay is not None:
+            done, _ = wait(attempts, timeout=delay)
+            if not done and self._take_budget():
+                print(f"DEBUG: No first token from {model} after {delay * 1000:.0f}ms, hedging")
+                attempts.append(self._launch(model, open_stream, primary=False))
+        else:
+            wait(attempts)
+
+        pending = set(attempts)
+        winner = None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if winner is None and future.exception() is None:
+                    winner = future
+
+        # Cancel the loser: close its stream now, or as soon as it opens
+        for future in attempts:
+            if future is not winner:
+                future.add_done_callback(_close_quietly)
+
+        if winner is None:
+            raise primary.exception()
+
+        with self._lock:
+            self._served.append(time.perf_counter() - started)
+            if winner is not primary:
+                self._counters["hedgeWins"] += 1
+        return HedgedStream(*winner.result())
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            primary = list(self._primary)
+            served = list(self._served)
+        report = {**counters, "enabled": self.enabled, "budget": self.budget, "percentile": self.percentile}
+        if counters["requests"]:
+            report["hedgeRate"] = round(counters["hedged"] / counters["requests"], 4)
+        for name, samples in (("primaryTtftMs", primary), ("servedTtftMs", served)):
+            if samples:
+                report[name] = {f"p{int(p * 100)}": round(_percentile(samples, p) * 1000, 1) for p in (0.5, 0.95, 0.99)}
+        return report
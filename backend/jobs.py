@@ -0,0 +1,163 @@
+"""
+Background jobs for long-running generations.
+
+POST /api/jobs stores a job in `db.jobs` and returns its id straight away; the
+generation runs on a per-process thread pool and its result (or error) is
+written back to the job document, where GET /api/jobs/<id> finds it. A client
+that retries the same request while the first job is still queued or running
+gets the existing job id back instead of starting the work twice.
+
+Jobs live in the worker process that accepted them, which refreshes their
+`updated_at` every JOB_TIMEOUT / 3 seconds while they are queued or running. One
+that has not been refreshed for JOB_TIMEOUT seconds (its process restarted,
+say) is reported as failed. Jobs wait up to JOB_QUEUE_TIMEOUT seconds for an
+upstream slot - much longer than interactive requests, since nobody is blocked
+on the response.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT", "900"))
+JOB_QUEUE_TIMEOUT = float(os.getenv("JOB_QUEUE_TIMEOUT", "600"))
+
+ACTIVE_STATES = ("queued", "running")
+
+
+def job_dedupe_key(user_id, params):
+    payload = json.dumps({"user_id": user_id, **params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _as_utc(value):
+    return value.replace(tzinfo=timezone.utc) if value is not None and value.tzinfo is None else value
+
+
+class JobRunner:
+    def __init__(self, db, workers=JOB_WORKERS, timeout=JOB_TIMEOUT):
+        self.db = db
+        self.workers = workers
+        self.timeout = timeout
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._active = set()
+        self._counters = {"submitted": 0, "deduplicated": 0, "succeeded": 0, "failed": 0, "running": 0}
+
+    def _executor(self):
+        # Threads do not survive a fork - build the pool in the process that uses it
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+                self._pool_pid = os.getpid()
+                self._active = set()
+                threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
+            return self._pool
+
+    def _heartbeat(self):
+        """Keep updated_at fresh for this process's jobs so long runs are not reported as lost"""
+        pid = os.getpid()
+        while self._pool_pid == pid:
+            time.sleep(self.timeout / 3)
+            with self._lock:
+                job_ids = list(self._active)
+            if not job_ids:
+                continue
+            try:
+                self.db.jobs.update_many({"_id": {"$in": job_ids}, "status": {"$in": list(ACTIVE_STATES)}},
+                                         {"$set": {"updated_at": datetime.now(timezone.utc)}})
+            except Exception as e:
+                print(f"ERROR: Job heartbeat failed: {e}")
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def submit(self, user_id, params, work):
+        """
+        Queue `work()` (returning the generated text) and return (job, created).
+        `params` describes the request; identical params from the same user reuse an active job.
+        """
+        dedupe_key = job_dedupe_key(user_id, params)
+        existing = self.db.jobs.find_one({"user_id": user_id, "dedupe_key": dedupe_key, "status": {"$in": list(ACTIVE_STATES)}})
+        if existing and not self._expired(existing):
+            self._count("deduplicated")
+            return existing, False
+
+        now = datetime.now(timezone.utc)
+        job = {
+            "_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "dedupe_key": dedupe_key,
+            "status": "queued",
+            "request": params,
+            "created_at": now,
+            "updated_at": now
+        }
+        self.db.jobs.insert_one(job)
+        self._count("submitted")
+        executor = self._executor()
+        with self._lock:
+            self._active.add(job["_id"])
+        executor.submit(self._run, job["_id"], work)
+        return job, True
+
+    def _update(self, job_id, fields):
+        fields["updated_at"] = datetime.now(timezone.utc)
+        self.db.jobs.update_one({"_id": job_id}, {"$set": fields})
+
+    def _run(self, job_id, work):
+        self._count("running")
+        self._update(job_id, {"status": "running", "started_at": datetime.now(timezone.utc)})
+        try:
+            content = work()
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self._update(job_id, {"status": "failed", "error": str(e), "error_status": getattr(e, "status", 500),
+                                  "finished_at": datetime.now(timezone.utc)})
+            self._count("failed")
+        else:
+            self._update(job_id, {"status": "succeeded", "content": content, "finished_at": datetime.now(timezone.utc)})
+            self._count("succeeded")
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+            self._count("running", -1)
+
+    def _expired(self, job):
+        updated = _as_utc(job.get("updated_at"))
+        return job["status"] in ACTIVE_STATES and updated is not None and \
+            datetime.now(timezone.utc) - updated > timedelta(seconds=self.timeout)
+
+    def get(self, job_id, user_id):
+        job = self.db.jobs.find_one({"_id": job_id, "user_id": user_id})
+        if job and self._expired(job):
+            self._update(job_id, {"status": "failed", "error": "Job was interrupted, please submit it again.", "error_status": 503})
+            job = self.db.jobs.find_one({"_id": job_id})
+        return job
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, "workers": self.workers}
+
+
+def job_payload(job):
+    """Public view of a job document"""
+    payload = {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "request": job.get("request"),
+        "created_at": job.get("created_at"),
+        "finished_at": job.get("finished_at")
+    }
+    if job["status"] == "succeeded":
+        payload["content"] = job.get("content")
+    elif job["status"] == "failed":
+        payload["error"] = job.get("error")
+    return payload
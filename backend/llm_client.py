@@ -0,0 +1,82 @@
+"""
+Process-wide Groq client shared by every route.
+
+Building a Groq client per request opens a fresh HTTP connection (TLS handshake
+included) on the hottest path. This module lazily creates one client per worker
+process on top of a keep-alive httpx connection pool and hands the same instance
+to app.py and pdf_chat.py. upstream.ResilientUpstream does its own retries, so it
+asks for a variant with the SDK's retries turned off (sharing the same pool);
+direct callers such as pdf_chat.py keep the SDK defaults.
+"""
+import os
+import threading
+
+import httpx
+
+# =============================
+# CONFIG
+# =============================
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", str(LLM_POOL_SIZE)))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+# Serve completions from fake_upstream instead of Groq (local load and failure testing)
+LLM_FAKE_UPSTREAM = os.getenv("LLM_FAKE_UPSTREAM", "false").lower() == "true"
+
+_client = None
+_client_pid = None
+_client_key = None
+_no_retry_client = None
+_lock = threading.Lock()
+
+
+def _build_client(api_key):
+    if LLM_FAKE_UPSTREAM:
+        from fake_upstream import FakeUpstream
+        return FakeUpstream(
+            latency=float(os.getenv("FAKE_UPSTREAM_LATENCY", "0.5")),
+            jitter=float(os.getenv("FAKE_UPSTREAM_JITTER", "0.5")),
+            error_rate=float(os.getenv("FAKE_UPSTREAM_ERROR_RATE", "0"))
+        )
+
+    from groq import Groq
+
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=LLM_POOL_SIZE,
+            max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+    )
+    return Groq(api_key=api_key, http_client=http_client)
+
+
+def get_llm_client(api_key=None, sdk_retries=True):
+    """
+    Return the shared Groq client for this worker, creating it on first use.
+    The client is rebuilt after a fork (gunicorn --preload) or when the API key changes,
+    since pooled sockets must never be shared across processes.
+    With sdk_retries=False the same client is returned with the SDK's own retries disabled,
+    for callers that retry themselves (SDK retries would multiply theirs).
+    """
+    global _client, _client_pid, _client_key, _no_retry_client
+
+    api_key = api_key or os.getenv("GROQ_API_KEY")
+    pid = os.getpid()
+    if not (_client is not None and _client_pid == pid and _client_key == api_key):
+        with _lock:
+            if _client is None or _client_pid != pid or _client_key != api_key:
+                _client = _build_client(api_key)
+                _client_pid = pid
+                _client_key = api_key
+                _no_retry_client = None
+
+    if sdk_retries:
+        return _client
+    with _lock:
+        if _no_retry_client is None:
+            with_options = getattr(_client, "with_options", None)
+            _no_retry_client = with_options(max_retries=0) if with_options else _client
+        return _no_retry_client
@@ -0,0 +1,146 @@
+"""
+Map-reduce condensation of large documents.
+
+Summaries and formula sheets need the whole document, not the first few
+thousand characters. The document is split into large chunks that are
+condensed concurrently (map) into content-type independent notes - key points,
+definitions and every formula - which are then merged (reduce) until they fit
+the context budget of the final request.
+
+Map results are cached by chunk hash, so re-running a document, or asking for a
+different content type on the same document, reuses them without upstream calls.
+Notes written by a fallback model are used but never cached under the requested
+model's keys.
+"""
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from retrieval import chunk_text
+from token_budget import count_tokens, chars_for_tokens, truncate_to_tokens
+
+MAP_CHUNK_CHARS = int(os.getenv("MAP_CHUNK_CHARS", "12000"))
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", "4"))
+MAP_MAX_TOKENS = int(os.getenv("MAP_MAX_TOKENS", "1024"))
+REDUCE_INPUT_TOKENS = int(os.getenv("REDUCE_INPUT_TOKENS", "6000"))
+CONDENSED_TOKEN_BUDGET = int(os.getenv("CONDENSED_TOKEN_BUDGET", "3000"))
+MAP_CACHE_TIMEOUT = int(os.getenv("MAP_CACHE_TIMEOUT", str(7 * 24 * 3600)))
+MAX_REDUCE_ROUNDS = 3
+
+# Content types that need the whole document rather than the most relevant excerpts
+WHOLE_DOCUMENT_TYPES = {"Summary", "Formula Sheet"}
+
+# Bump when the map/reduce instructions change so stale notes are not reused
+PROMPT_VERSION = "v1"
+
+MAP_PROMPT = (
+    "You condense one excerpt of a longer academic document into notes. "
+    "Return concise bullet notes covering the key points and definitions, and list EVERY formula "
+    "exactly as written together with the meaning of each variable and its units. "
+    "Do not add information that is not in the excerpt."
+)
+
+REDUCE_PROMPT = (
+    "You merge partial notes taken from consecutive parts of one academic document. "
+    "Combine them into a single deduplicated set of concise bullet notes in document order. "
+    "Keep EVERY distinct formula with its variable meanings."
+)
+
+
+def needs_condensing(text, content_type, budget=CONDENSED_TOKEN_BUDGET):
+    if content_type not in WHOLE_DOCUMENT_TYPES:
+        return False
+    # Skip tokenizing very long documents - they are over budget either way
+    return len(text) > chars_for_tokens(budget) or count_tokens(text) > budget
+
+
+def _key(kind, model, text):
+    digest = hashlib.sha256(f"{PROMPT_VERSION}:{model}:{text}".encode("utf-8")).hexdigest()
+    return f"{kind}:{digest}"
+
+
+def _map_chunk(chunk, complete, cache, model):
+    """Return (notes, cache_hit, model_used) for one chunk"""
+    key = _key("map", model, chunk)
+    notes = cache.get(key)
+    if notes is not None:
+        return notes, True, model
+
+    notes, model_used = complete([
+        {"role": "system", "content": MAP_PROMPT},
+        {"role": "user", "content": chunk}
+    ], MAP_MAX_TOKENS)
+    if model_used == model:
+        cache.set(key, notes, timeout=MAP_CACHE_TIMEOUT)
+    return notes, False, model_used
+
+
+def _reduce_round(notes, complete, model, report):
+    """Merge neighbouring notes in groups that fit one reduce request"""
+    groups, current, used = [], [], 0
+    for note in notes:
+        cost = count_tokens(note)
+        if current and used + cost > REDUCE_INPUT_TOKENS:
+            groups.append(current)
+            current, used = [], 0
+        current.append(note)
+        used += cost
+    if current:
+        groups.append(current)
+
+    def merge(group):
+        if len(group) == 1:
+            return group[0], model
+        return complete([
+            {"role": "system", "content": REDUCE_PROMPT},
+            {"role": "user", "content": "\n\n---\n\n".join(group)}
+        ], MAP_MAX_TOKENS * 2)
+
+    report["reduce_calls"] += sum(1 for group in groups if len(group) > 1)
+    with ThreadPoolExecutor(max_workers=MAP_REDUCE_CONCURRENCY) as pool:
+        merged = list(pool.map(merge, groups))
+    report["fallbacks"] += sum(1 for _, used in merged if used != model)
+    return [n for n, _ in merged]
+
+
+def condense_document(text, complete, cache, model, budget=CONDENSED_TOKEN_BUDGET):
+    """
+    Condense a whole document into notes that fit `budget` tokens.
+    `complete(messages, max_tokens)` performs one upstream call and returns (text, model_used);
+    `cache` is any object with get(key) / set(key, value, timeout=...).
+    Returns (notes, report).
+    """
+    started = time.perf_counter()
+    report = {"chunks": 0, "map_calls": 0, "map_cache_hits": 0, "reduce_calls": 0, "rounds": 0, "fallbacks": 0}
+
+    final_key = _key("condensed", model, f"{budget}:{text}")
+    condensed = cache.get(final_key)
+    if condensed is not None:
+        report["cached"] = True
+        report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return condensed, report
+
+    chunks = [c["text"] for c in chunk_text(text, [], size=MAP_CHUNK_CHARS, overlap=0)]
+    report["chunks"] = len(chunks)
+
+    with ThreadPoolExecutor(max_workers=MAP_REDUCE_CONCURRENCY) as pool:
+        mapped = list(pool.map(lambda chunk: _map_chunk(chunk, complete, cache, model), chunks))
+    notes = [n for n, _, _ in mapped]
+    report["map_cache_hits"] = sum(1 for _, hit, _ in mapped if hit)
+    report["fallbacks"] = sum(1 for _, _, used in mapped if used != model)
+    report["map_calls"] = len(mapped) - report["map_cache_hits"]
+
+    while len(notes) > 1 and count_tokens("\n\n".join(notes)) > budget and report["rounds"] < MAX_REDUCE_ROUNDS:
+        notes = _reduce_round(notes, complete, model, report)
+        report["rounds"] += 1
+
+    condensed = "\n\n".join(notes)
+    # Budget is a hard cap for the final request, even if merging could not get below it
+    condensed = truncate_to_tokens(condensed, budget)
+    if not report["fallbacks"]:
+        cache.set(final_key, condensed, timeout=MAP_CACHE_TIMEOUT)
+
+    report["cached"] = False
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return condensed, report
@@ -0,0 +1,120 @@
+"""
+Mode- and content-type-aware model selection.
+
+Telescope requests and short content types do not need the 70B model; they
+are routed to a small, fast model while long-form and deep/thinking requests
+stay on the large one. Routes are looked up most-specific first:
+"mode:content_type", "mode:*", "*:content_type", then "*:*". A route value is
+either an alias ("small" / "large") or a literal model id, and the whole
+table can be overridden with MODEL_ROUTES (JSON). FALLBACK_MODELS lists the
+models upstream.py falls back to (MODEL_FALLBACKS). Per-model latency is kept
+over a sliding window for the admin stats.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+LARGE_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+SMALL_MODEL = os.getenv("GROQ_SMALL_MODEL", "llama-3.1-8b-instant")
+LATENCY_WINDOW = int(os.getenv("MODEL_LATENCY_WINDOW", "200"))
+
+MODEL_ALIASES = {"small": SMALL_MODEL, "large": LARGE_MODEL}
+
+DEFAULT_ROUTES = {
+    "telescope:*": "small",
+    "deep:*": "large",
+    "thinking:*": "large",
+    "*:Summary": "small",
+    "*:Motivation of Goals": "small",
+    "*:Social Media Script": "small",
+    "*:*": "large"
+}
+
+
+def _load_routes():
+    routes = dict(DEFAULT_ROUTES)
+    override = os.getenv("MODEL_ROUTES")
+    if override:
+        try:
+            routes.update(json.loads(override))
+        except ValueError as e:
+            print(f"WARNING: Ignoring invalid MODEL_ROUTES ({e})")
+    return routes
+
+
+ROUTES = _load_routes()
+
+# Models tried, in order, when a model is rate limited or its circuit breaker is open
+FALLBACK_MODELS = {LARGE_MODEL: [SMALL_MODEL], SMALL_MODEL: [LARGE_MODEL]}
+if os.getenv("MODEL_FALLBACKS"):
+    try:
+        FALLBACK_MODELS = json.loads(os.getenv("MODEL_FALLBACKS"))
+    except ValueError as e:
+        print(f"WARNING: Ignoring invalid MODEL_FALLBACKS ({e})")
+
+_lock = threading.Lock()
+_latency = {}
+_counters = {}
+
+
+def route(mode, content_type):
+    """Return (model, matched_rule) for a request"""
+    for rule in (f"{mode}:{content_type}", f"{mode}:*", f"*:{content_type}", "*:*"):
+        target = ROUTES.get(rule)
+        if target:
+            return MODEL_ALIASES.get(target, target), rule
+    return LARGE_MODEL, "default"
+
+
+def choose_model(mode, content_type):
+    model, rule = route(mode, content_type)
+    print(f"DEBUG: Routed {mode}/{content_type} -> {model} ({rule})")
+    with _lock:
+        _counters.setdefault(model, {"routed": 0, "errors": 0})["routed"] += 1
+    return model
+
+
+def record_latency(model, seconds):
+    with _lock:
+        _latency.setdefault(model, deque(maxlen=LATENCY_WINDOW)).append(seconds * 1000)
+
+
+@contextmanager
+def timed(model):
+    """Time one upstream call; failures are counted, not timed"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        with _lock:
+            _counters.setdefault(model, {"routed": 0, "errors": 0})["errors"] += 1
+        raise
+    elapsed = time.perf_counter() - started
+    record_latency(model, elapsed)
+    print(f"DEBUG: {model} responded in {elapsed * 1000:.0f}ms")
+
+
+def _percentile(ordered, pct):
+    return round(ordered[min(int(len(ordered) * pct), len(ordered) - 1)], 1)
+
+
+def stats():
+    with _lock:
+        samples = {model: sorted(window) for model, window in _latency.items()}
+        counters = {model: dict(c) for model, c in _counters.items()}
+
+    models = {}
+    for model in set(samples) | set(counters):
+        ordered = samples.get(model, [])
+        entry = {**counters.get(model, {"routed": 0, "errors": 0}), "samples": len(ordered)}
+        if ordered:
+            entry.update({
+                "avgMs": round(sum(ordered) / len(ordered), 1),
+                "p50Ms": _percentile(ordered, 0.5),
+                "p95Ms": _percentile(ordered, 0.95)
+            })
+        models[model] = entry
+    return {"routes": ROUTES, "models": models}
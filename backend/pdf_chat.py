@@ -1,15 +1,13 @@
 import streamlit as st
-import PyPDF2
+import importlib.util
 import os
-from io import BytesIO
 from dotenv import load_dotenv
 
-# Optional Groq client check
-try:
-    from groq import Groq
-    _HAS_GROQ = True
-except Exception:
-    _HAS_GROQ = False
+from llm_client import get_llm_client
+from text_extraction import extract_text
+
+# Optional Groq client check - llm_client imports the SDK itself when a client is first built
+_HAS_GROQ = importlib.util.find_spec("groq") is not None
 
 # Load environment variables
 load_dotenv()
@@ -39,11 +37,8 @@ if "active_resource" not in st.session_state:
 # Function to extract text from PDF
 def extract_text_from_pdf(uploaded_file):
     try:
-        pdf_reader = PyPDF2.PdfReader(uploaded_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-        return text
+        # Only the first 10k characters are ever used as context
+        return extract_text(uploaded_file, char_budget=10000)["text"]
     except Exception as e:
         st.error(f"Error extracting text: {e}")
         return ""
@@ -64,8 +59,7 @@ def get_ai_response(prompt, context=""):
 
     # Try official groq client first (if installed)
     try:
-        from groq import Groq
-        client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        client = get_llm_client(os.getenv("GROQ_API_KEY"))
         completion = client.chat.completions.create(
             model=MODEL,
             messages=[
@@ -0,0 +1,108 @@
+"""
+Upload-once storage for PDF documents used by /api/pdf-chat.
+
+A PDF is parsed a single time; its extracted text and per-page character
+offsets are stored in `db.pdf_documents` under the SHA-256 of the file bytes,
+which doubles as the document id. Follow-up questions reference the id and skip
+upload and parsing entirely. Recently used documents are also kept in an
+in-process LRU, bounded by total text size (PDF_DOC_CACHE_BYTES), so repeat
+questions do not even pay the Mongo round-trip.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from text_extraction import describe_timings
+
+PDF_DOC_CACHE_BYTES = int(os.getenv("PDF_DOC_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Stay clear of Mongo's 16 MB document limit
+MAX_STORED_TEXT_CHARS = 12 * 1024 * 1024
+
+_doc_cache = OrderedDict()
+_doc_cache_bytes = 0
+_doc_cache_lock = threading.Lock()
+
+
+class PdfDocumentError(Exception):
+    pass
+
+
+def _doc_bytes(doc):
+    # Text dominates; page offsets are small ints
+    return len(doc.get("text", "")) + 8 * len(doc.get("page_offsets", []))
+
+
+def _remember(doc):
+    global _doc_cache_bytes
+    size = _doc_bytes(doc)
+    if size > PDF_DOC_CACHE_BYTES:
+        return
+    with _doc_cache_lock:
+        previous = _doc_cache.pop(doc["_id"], None)
+        if previous is not None:
+            _doc_cache_bytes -= _doc_bytes(previous)
+        _doc_cache[doc["_id"]] = doc
+        _doc_cache_bytes += size
+        while _doc_cache_bytes > PDF_DOC_CACHE_BYTES:
+            _, evicted = _doc_cache.popitem(last=False)
+            _doc_cache_bytes -= _doc_bytes(evicted)
+
+
+def ingest_pdf(db, upload, user_id):
+    """
+    Store an uploaded PDF (an uploads.SpooledUpload) once and return (doc, created).
+    Re-uploading identical bytes returns the existing document without re-parsing.
+    """
+    doc_id = upload.sha256
+    filename = upload.filename
+    doc = get_pdf_document(db, doc_id)
+    if doc:
+        if user_id not in doc.get("user_ids", []):
+            db.pdf_documents.update_one({"_id": doc_id}, {"$addToSet": {"user_ids": user_id}})
+            doc = {**doc, "user_ids": doc.get("user_ids", []) + [user_id]}
+            _remember(doc)
+        return doc, False
+
+    extraction = upload.extract_pdf()
+    print(f"DEBUG: Extracted {filename}: {describe_timings(extraction)}")
+    text, page_offsets = extraction["text"], extraction["page_offsets"]
+    if not text.strip():
+        raise PdfDocumentError("Could not extract text from PDF")
+    if len(text) > MAX_STORED_TEXT_CHARS:
+        raise PdfDocumentError("PDF text is too large to store")
+
+    doc = {
+        "_id": doc_id,
+        "filename": filename,
+        "text": text,
+        "page_offsets": page_offsets,
+        "page_count": len(page_offsets),
+        "char_count": len(text),
+        "user_ids": [user_id],
+        "created_at": datetime.now(timezone.utc)
+    }
+    # Two workers may race on the same new upload - the content hash makes that harmless
+    db.pdf_documents.update_one({"_id": doc_id}, {"$setOnInsert": doc}, upsert=True)
+    _remember(doc)
+    return doc, True
+
+
+def get_pdf_document(db, doc_id, user_id=None):
+    """
+    Return the stored document, or None.
+    With `user_id`, documents that user never uploaded are treated as missing.
+    """
+    with _doc_cache_lock:
+        doc = _doc_cache.get(doc_id)
+        if doc is not None:
+            _doc_cache.move_to_end(doc_id)
+
+    if doc is None:
+        doc = db.pdf_documents.find_one({"_id": doc_id})
+        if doc:
+            _remember(doc)
+
+    if doc and user_id is not None and user_id not in doc.get("user_ids", []):
+        return None
+    return doc
@@ -0,0 +1,116 @@
+"""
+In-memory registry of the prompt fragments shipped in the repo's prompts/ directory.
+
+Every *.txt file is read once into memory under its file name without the
+extension (e.g. "quiz_prompt"). Requests never touch the disk: the directory
+is re-scanned at most once every PROMPT_RELOAD_INTERVAL seconds, and only files
+whose mtime or size changed are re-read. Each change bumps `version`, which
+prompt builders fold into their memo keys so edited fragments are picked up
+without a restart.
+"""
+import os
+import textwrap
+import threading
+import time
+
+PROMPTS_DIR = os.getenv("PROMPTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "prompts"))
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "5"))
+
+
+def compact(text):
+    """Drop source indentation, trailing spaces and blank lines - they only cost upstream tokens"""
+    lines = (line.rstrip() for line in textwrap.dedent(text).splitlines())
+    return "\n".join(line for line in lines if line.strip())
+
+
+class PromptRegistry:
+    """Fragments from one directory, kept in memory and refreshed when their files change"""
+
+    def __init__(self, directory=PROMPTS_DIR, reload_interval=PROMPT_RELOAD_INTERVAL):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.version = 0
+        self.reloads = 0
+        self._fragments = {}
+        self._raw = {}
+        self._stamps = {}
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        stamps = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError as e:
+            print(f"WARNING: Prompt fragments unavailable ({e})")
+            return stamps
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(".txt"):
+                st = entry.stat()
+                stamps[entry.name[:-4]] = (st.st_mtime_ns, st.st_size, entry.path)
+        return stamps
+
+    def _refresh(self):
+        stamps = self._scan()
+        changed = {name for name, stamp in stamps.items() if self._stamps.get(name, (None,))[:2] != stamp[:2]}
+        removed = set(self._stamps) - set(stamps)
+        if not changed and not removed:
+            return
+
+        fragments = dict(self._fragments)
+        raw = dict(self._raw)
+        for name in removed:
+            fragments.pop(name, None)
+            raw.pop(name, None)
+        for name in changed:
+            try:
+                with open(stamps[name][2], encoding="utf-8") as fh:
+                    raw[name] = fh.read()
+            except OSError as e:
+                print(f"WARNING: Could not read prompt fragment {name}: {e}")
+                stamps.pop(name)
+                continue
+            fragments[name] = compact(raw[name])
+
+        # Swap whole dicts so readers never see a half-updated registry
+        self._fragments, self._raw, self._stamps = fragments, raw, stamps
+        self.version += 1
+        if self.version > 1:
+            self.reloads += 1
+            print(f"DEBUG: Reloaded prompt fragments: {', '.join(sorted(changed | removed))}")
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._refresh()
+            self._next_check = now + self.reload_interval
+
+    def get(self, name, default=""):
+        """Compacted text of a fragment"""
+        self._maybe_refresh()
+        return self._fragments.get(name, default)
+
+    def raw(self, name, default=""):
+        """Fragment text exactly as stored on disk"""
+        self._maybe_refresh()
+        return self._raw.get(name, default)
+
+    def current_version(self):
+        self._maybe_refresh()
+        return self.version
+
+    def stats(self):
+        return {
+            "directory": os.path.normpath(self.directory),
+            "fragments": sorted(self._fragments),
+            "version": self.version,
+            "reloads": self.reloads,
+            "reloadInterval": self.reload_interval
+        }
+
+
+registry = PromptRegistry()
@@ -0,0 +1,278 @@
+"""
+Shared, persistent response cache for /api/generate.
+
+SimpleCache keeps a private dict per gunicorn worker that is lost on restart.
+SQLiteStore keeps entries in a single SQLite file on local disk (WAL mode), so
+every worker on the host shares one cache that survives restarts. Entries carry
+a per-entry TTL, the store is bounded by entry count and total bytes with LRU
+eviction, and hit/miss/eviction counters are kept in the same file.
+
+Reads never write: hit/miss counters and LRU access times are buffered per
+process and flushed in one transaction every STATS_FLUSH_INTERVAL seconds (an
+entry's access time is only refreshed once it is ACCESS_RESOLUTION seconds
+old). A locked database is a cache miss, or a skipped store, never an error.
+
+SQLiteCache adapts the store to Flask-Caching, so it is selected like any other
+backend: CACHE_TYPE = "response_cache.SQLiteCache".
+"""
+import atexit
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from flask_caching.backends.base import BaseCache
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(__file__), "cache", "response_cache.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+STAT_NAMES = ("hits", "misses", "sets", "evictions", "expired")
+STATS_FLUSH_INTERVAL = float(os.getenv("RESPONSE_CACHE_STATS_FLUSH_INTERVAL", "5"))
+ACCESS_RESOLUTION = 30
+
+
+class SQLiteStore:
+    """Size-bounded LRU key/value store with per-entry TTL backed by one SQLite file"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=5000, max_bytes=256 * 1024 * 1024, default_timeout=600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_timeout = default_timeout
+        self._local = threading.local()
+        self._pending_lock = threading.Lock()
+        self._pending_pid = os.getpid()
+        self._pending_stats = {}
+        self._pending_access = {}
+        self._last_flush = time.monotonic()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        conn.executemany("INSERT OR IGNORE INTO stats (name, value) VALUES (?, 0)", [(n,) for n in STAT_NAMES])
+        atexit.register(self.flush)
+
+    def _conn(self):
+        # One connection per thread and per process - sqlite3 connections must not cross a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _expiry(self, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        return time.time() + timeout if timeout > 0 else None
+
+    def _bump(self, conn, name, amount=1):
+        conn.execute("UPDATE stats SET value = value + ? WHERE name = ?", (amount, name))
+
+    def _record(self, stat, key=None, accessed_at=None):
+        """Buffer a counter bump (and an access time) for the next flush"""
+        with self._pending_lock:
+            if self._pending_pid != os.getpid():
+                # Inherited across a fork - the parent flushes its own
+                self._pending_pid = os.getpid()
+                self._pending_stats, self._pending_access = {}, {}
+            self._pending_stats[stat] = self._pending_stats.get(stat, 0) + 1
+            if key is not None:
+                self._pending_access[key] = accessed_at
+            due = time.monotonic() - self._last_flush >= STATS_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write buffered counters and access times in one transaction; kept for later if the file is locked"""
+        with self._pending_lock:
+            if self._pending_pid != os.getpid():
+                return
+            stats, self._pending_stats = self._pending_stats, {}
+            access, self._pending_access = self._pending_access, {}
+            self._last_flush = time.monotonic()
+        if not stats and not access:
+            return
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("UPDATE cache SET accessed_at = ? WHERE key = ? AND accessed_at < ?",
+                                 [(when, key, when) for key, when in access.items()])
+                conn.executemany("UPDATE stats SET value = value + ? WHERE name = ?",
+                                 [(amount, name) for name, amount in stats.items()])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.OperationalError as e:
+            print(f"WARNING: Response cache stats flush deferred: {e}")
+            with self._pending_lock:
+                for name, amount in stats.items():
+                    self._pending_stats[name] = self._pending_stats.get(name, 0) + amount
+                for key, when in access.items():
+                    self._pending_access.setdefault(key, when)
+
+    def get(self, key):
+        now = time.time()
+        try:
+            row = self._conn().execute("SELECT value, expires_at, accessed_at FROM cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.OperationalError as e:
+            print(f"WARNING: Response cache read failed, treating as a miss: {e}")
+            self._record("misses")
+            return None
+        if row is None:
+            self._record("misses")
+            return None
+
+        value, expires_at, accessed_at = row
+        if expires_at is not None and expires_at <= now:
+            # Removed (and counted as expired) by the next eviction pass
+            self._record("misses")
+            return None
+
+        if now - accessed_at >= ACCESS_RESOLUTION:
+            self._record("hits", key, now)
+        else:
+            self._record("hits")
+        return pickle.loads(value)
+
+    def has(self, key):
+        try:
+            row = self._conn().execute(
+                "SELECT 1 FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+            ).fetchone()
+        except sqlite3.OperationalError:
+            return False
+        return row is not None
+
+    def set(self, key, value, timeout=None, only_if_missing=False):
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return False
+
+        conn = self._conn()
+        now = time.time()
+        verb = "INSERT OR IGNORE" if only_if_missing else "INSERT OR REPLACE"
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            # Another worker holds the write lock - skipping the store only costs a future miss
+            print(f"WARNING: Response cache store skipped: {e}")
+            return False
+        try:
+            if only_if_missing:
+                conn.execute("DELETE FROM cache WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?", (key, now))
+            cur = conn.execute(
+                f"{verb} INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(blob), len(blob), self._expiry(timeout), now)
+            )
+            stored = cur.rowcount > 0
+            if stored:
+                self._bump(conn, "sets")
+                self._evict(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return stored
+
+    def _evict(self, conn, now):
+        """Drop expired entries, then least recently used ones until both limits hold"""
+        expired = conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)).rowcount
+        if expired:
+            self._bump(conn, "expired", expired)
+
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed_at"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+        self._bump(conn, "evictions", len(victims))
+
+    def delete(self, key):
+        return self._conn().execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount > 0
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache")
+        return True
+
+    def stats(self):
+        self.flush()
+        conn = self._conn()
+        counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+        entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        lookups = counters.get("hits", 0) + counters.get("misses", 0)
+        return {
+            **counters,
+            "entries": entries,
+            "bytes": total,
+            "maxEntries": self.max_entries,
+            "maxBytes": self.max_bytes,
+            "hitRate": round(counters.get("hits", 0) / lookups, 4) if lookups else 0.0
+        }
+
+
+class SQLiteCache(BaseCache):
+    """Flask-Caching backend on top of SQLiteStore"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=5000, max_bytes=256 * 1024 * 1024, default_timeout=600,
+                 ignore_delete_many_errors=False):
+        super().__init__(default_timeout=default_timeout, ignore_delete_many_errors=ignore_delete_many_errors)
+        self.store = SQLiteStore(path, max_entries, max_bytes, default_timeout)
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update({
+            "path": config.get("CACHE_SQLITE_PATH", DEFAULT_CACHE_PATH),
+            "max_entries": config.get("CACHE_THRESHOLD", 5000),
+            "max_bytes": config.get("CACHE_SQLITE_MAX_BYTES", 256 * 1024 * 1024)
+        })
+        return cls(*args, **kwargs)
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, timeout=None):
+        return self.store.set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        return self.store.set(key, value, timeout, only_if_missing=True)
+
+    def delete(self, key):
+        return self.store.delete(key)
+
+    def has(self, key):
+        return self.store.has(key)
+
+    def clear(self):
+        return self.store.clear()
+
+    def stats(self):
+        return self.store.stats()
@@ -0,0 +1,165 @@
+"""
+Lexical retrieval over stored PDF documents.
+
+Instead of sending the first few thousand characters of a document upstream,
+the whole text is split into overlapping chunks, indexed with Okapi BM25, and
+only the top-k chunks relevant to the question are sent - within a token
+budget. Indexes are built once per document and kept in an in-process LRU
+bounded by their approximate size in bytes (PDF_INDEX_CACHE_BYTES).
+"""
+import math
+import os
+import re
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+
+from token_budget import count_tokens
+
+CHUNK_CHARS = int(os.getenv("PDF_CHUNK_CHARS", "1200"))
+CHUNK_OVERLAP = int(os.getenv("PDF_CHUNK_OVERLAP", "200"))
+RETRIEVAL_TOP_K = int(os.getenv("PDF_RETRIEVAL_TOP_K", "8"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("PDF_CONTEXT_TOKEN_BUDGET", "2500"))
+INDEX_CACHE_BYTES = int(os.getenv("PDF_INDEX_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Rough CPython cost of one (chunk, tf) posting tuple plus its list slot, and of one term entry
+POSTING_BYTES = 72
+TERM_BYTES = 120
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "an", "the", "of", "on", "in", "to", "for", "and", "or", "is", "are", "was", "were", "be",
+    "what", "which", "who", "how", "why", "when", "where", "does", "do", "did", "this", "that", "these",
+    "those", "it", "its", "with", "as", "by", "at", "from", "me", "please", "explain", "about", "can", "you"
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_index_cache = OrderedDict()
+_index_cache_bytes = 0
+_index_cache_lock = threading.Lock()
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def chunk_text(text, page_offsets, size=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Split text into overlapping windows cut on whitespace, tagged with their 1-based page number"""
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + size, length)
+        if end < length:
+            cut = text.rfind(" ", start + size // 2, end)
+            if cut != -1:
+                end = cut
+        body = text[start:end].strip()
+        if body:
+            page = bisect_right(page_offsets, start) if page_offsets else 1
+            chunks.append({"text": body, "start": start, "page": max(page, 1)})
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+class BM25Index:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.lengths = []
+        self.postings = {}
+        for idx, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk["text"]))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((idx, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        self.approx_bytes = (sum(len(chunk["text"]) for chunk in chunks)
+                             + POSTING_BYTES * sum(len(p) for p in self.postings.values())
+                             + TERM_BYTES * len(self.postings))
+
+    def _idf(self, term):
+        df = len(self.postings.get(term, ()))
+        n = len(self.chunks)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query, top_k=RETRIEVAL_TOP_K):
+        """Return [(chunk_index, score)] sorted by descending BM25 score"""
+        scores = {}
+        for term in set(tokenize(query)):
+            idf = self._idf(term)
+            for idx, tf in self.postings.get(term, ()):
+                norm = 1 - BM25_B + BM25_B * self.lengths[idx] / (self.avg_length or 1)
+                scores[idx] = scores.get(idx, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+def get_index(doc):
+    """Return the BM25 index for a stored PDF document, building it on first use"""
+    with _index_cache_lock:
+        index = _index_cache.get(doc["_id"])
+        if index is not None:
+            _index_cache.move_to_end(doc["_id"])
+            return index
+
+    global _index_cache_bytes
+    index = BM25Index(chunk_text(doc["text"], doc.get("page_offsets", [])))
+    if index.approx_bytes > INDEX_CACHE_BYTES:
+        return index
+    with _index_cache_lock:
+        previous = _index_cache.pop(doc["_id"], None)
+        if previous is not None:
+            _index_cache_bytes -= previous.approx_bytes
+        _index_cache[doc["_id"]] = index
+        _index_cache_bytes += index.approx_bytes
+        while _index_cache_bytes > INDEX_CACHE_BYTES:
+            _, evicted = _index_cache.popitem(last=False)
+            _index_cache_bytes -= evicted.approx_bytes
+    return index
+
+
+def retrieve_context(doc, question, top_k=RETRIEVAL_TOP_K, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Select the chunks most relevant to the question within the token budget.
+    Returns (context, report) where report carries latency and per-chunk scores.
+    """
+    started = time.perf_counter()
+    index = get_index(doc)
+    indexed = time.perf_counter()
+
+    hits = index.search(question, top_k)
+    if not hits:
+        # Nothing lexical to match on ("summarize this") - fall back to the start of the document
+        hits = [(idx, 0.0) for idx in range(min(top_k, len(index.chunks)))]
+
+    selected = []
+    used = 0
+    for idx, score in hits:
+        cost = count_tokens(index.chunks[idx]["text"])
+        if used + cost > token_budget and selected:
+            continue
+        selected.append((idx, score))
+        used += cost
+
+    # Keep document order so the model reads the excerpts in sequence
+    selected.sort(key=lambda item: item[0])
+    context = "\n\n".join(
+        f"[Page {index.chunks[idx]['page']}]\n{index.chunks[idx]['text']}" for idx, _ in selected
+    )
+    finished = time.perf_counter()
+
+    report = {
+        "index_ms": round((indexed - started) * 1000, 2),
+        "latency_ms": round((finished - started) * 1000, 2),
+        "total_chunks": len(index.chunks),
+        "context_tokens": used,
+        "chunks": [
+            {"page": index.chunks[idx]["page"], "start": index.chunks[idx]["start"], "score": round(score, 4)}
+            for idx, score in selected
+        ]
+    }
+    return context, report
@@ -0,0 +1,153 @@
+"""
+Per-day analytics rollups in `db.daily_rollups`, one document per UTC day:
+
+    {_id: "2025-01-31", prompts, tokens, features: {content type: count},
+     promptUsers: [user ids], logins, loginUsers: [user ids], newUsers}
+
+`tokens` counts response (completion) tokens, as the admin metric always has:
+the upstream-reported completion count when history has one, otherwise the
+response length / CHARS_PER_TOKEN.
+
+`apply_events()` folds freshly written history/login documents into the
+rollups with $inc/$addToSet; the write-behind queue calls it after each
+successful insert_many, so the admin endpoints read a handful of small
+documents instead of aggregating over all history and logins.
+`record_new_user()` counts users created outside the write-behind path.
+
+Rollups start from zero on an existing database; rebuild them from the raw
+collections with
+
+    python rollups.py --backfill [--days N]
+"""
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+CHARS_PER_TOKEN = 4
+
+
+def day_key(when):
+    return when.strftime("%Y-%m-%d")
+
+
+def _feature_key(content_type):
+    # Field names may not contain "." or start with "$"
+    return str(content_type or "Unknown").replace(".", "_").lstrip("$")
+
+
+def _history_tokens(doc):
+    tokens = doc.get("tokens") or {}
+    if tokens.get("completion") is not None:
+        return tokens["completion"]
+    return len(doc.get("response") or "") // CHARS_PER_TOKEN
+
+
+def apply_events(db, events):
+    """Fold inserted (collection, doc) pairs into the daily rollups"""
+    updates = {}
+    for collection, doc in events:
+        if collection == "history":
+            day = day_key(doc["created_at"])
+            update = updates.setdefault(day, {"$inc": {}, "$addToSet": {}})
+            inc = update["$inc"]
+            inc["prompts"] = inc.get("prompts", 0) + 1
+            inc["tokens"] = inc.get("tokens", 0) + _history_tokens(doc)
+            feature = f"features.{_feature_key(doc.get('content_type'))}"
+            inc[feature] = inc.get(feature, 0) + 1
+            update["$addToSet"].setdefault("promptUsers", set()).add(doc["user_id"])
+        elif collection == "logins":
+            day = day_key(doc["timestamp"])
+            update = updates.setdefault(day, {"$inc": {}, "$addToSet": {}})
+            update["$inc"]["logins"] = update["$inc"].get("logins", 0) + 1
+            update["$addToSet"].setdefault("loginUsers", set()).add(doc["user_id"])
+
+    # A flush nearly always falls within one day, so this is usually a single update
+    for day, update in updates.items():
+        add_to_set = {field: {"$each": sorted(values)} for field, values in update["$addToSet"].items()}
+        change = {"$inc": update["$inc"]}
+        if add_to_set:
+            change["$addToSet"] = add_to_set
+        db.daily_rollups.update_one({"_id": day}, change, upsert=True)
+
+
+def record_new_user(db, created_at):
+    db.daily_rollups.update_one({"_id": day_key(created_at)}, {"$inc": {"newUsers": 1}}, upsert=True)
+
+
+def days_since(db, start_date, fields=None):
+    """Rollup documents from `start_date` (a datetime) onwards, oldest first"""
+    return list(db.daily_rollups.find({"_id": {"$gte": day_key(start_date)}}, fields).sort("_id", 1))
+
+
+def all_days(db, fields=None):
+    """Every rollup document; pass `fields` to leave out the per-day user id sets"""
+    return list(db.daily_rollups.find({}, fields).sort("_id", 1))
+
+
+def backfill(db, days=None):
+    """
+    Rebuild rollups from the raw history, logins and users collections.
+    With `days`, only the last `days` days are rebuilt. Returns the number of days written.
+    """
+    match = {}
+    if days is not None:
+        start = (datetime.now(timezone.utc) - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+        match = {"$gte": start}
+
+    def by_day(collection, field, group, pre=()):
+        pipeline = ([{"$match": {field: match}}] if match else []) + list(pre) + [
+            {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": f"${field}"}}, **group}}
+        ]
+        return {row["_id"]: row for row in db[collection].aggregate(pipeline, allowDiskUse=True)}
+
+    history = by_day("history", "created_at", {
+        "prompts": {"$sum": 1},
+        "tokens": {"$sum": {"$ifNull": ["$tokens.completion", {"$floor": {"$divide": [{"$strLenCP": {"$ifNull": ["$response", ""]}}, CHARS_PER_TOKEN]}}]}},
+        "promptUsers": {"$addToSet": "$user_id"}
+    })
+    features = {}
+    feature_pipeline = ([{"$match": {"created_at": match}}] if match else []) + [
+        {"$group": {"_id": {"day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}, "type": "$content_type"}, "count": {"$sum": 1}}}
+    ]
+    for row in db.history.aggregate(feature_pipeline, allowDiskUse=True):
+        features.setdefault(row["_id"]["day"], {})[_feature_key(row["_id"]["type"])] = row["count"]
+    logins = by_day("logins", "timestamp", {"logins": {"$sum": 1}, "loginUsers": {"$addToSet": "$user_id"}})
+    new_users = by_day("users", "created_at", {"newUsers": {"$sum": 1}})
+
+    written = 0
+    for day in sorted(set(history) | set(logins) | set(new_users)):
+        if day is None:
+            continue
+        h, l = history.get(day, {}), logins.get(day, {})
+        db.daily_rollups.replace_one({"_id": day}, {
+            "prompts": h.get("prompts", 0),
+            "tokens": int(h.get("tokens", 0)),
+            "features": features.get(day, {}),
+            "promptUsers": h.get("promptUsers", []),
+            "logins": l.get("logins", 0),
+            "loginUsers": l.get("loginUsers", []),
+            "newUsers": new_users.get(day, {}).get("newUsers", 0)
+        }, upsert=True)
+        written += 1
+    return written
+
+
+def main(argv):
+    import certifi
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    if "--backfill" not in argv:
+        print("usage: python rollups.py --backfill [--days N]")
+        return 2
+    days = int(argv[argv.index("--days") + 1]) if "--days" in argv else None
+
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'), override=True)
+    client = MongoClient(os.getenv("MONGO_URI"), tls=True, tlsCAFile=certifi.where(), serverSelectionTimeoutMS=5000)
+    written = backfill(client["eduwrite"], days)
+    print(f"Rebuilt {written} daily rollups")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,211 @@
+"""
+In-process near-duplicate cache for generation topics.
+
+Exact cache keys miss trivial rewordings such as "Explain Ohm's law",
+"explain ohms law" and "Ohm's Law explanation". Topics are vectorized offline
+with hashed word unigrams, word bigrams and character trigrams (no model
+download, no network). A new topic is answered from the closest stored topic
+in the same bucket (content_type, academic_year, mode, model) when their cosine
+similarity reaches SEMANTIC_CACHE_THRESHOLD.
+
+Similar wording is not enough when a small token flips the question, so a
+candidate must also agree on the guards: the same numbers ("Class 10" vs
+"Class 12"), the same symbol-bearing words ("C++" vs "C#"), the same negations
+("with" vs "without") and the same words on either side of a direction word
+("binary to decimal" vs "decimal to binary").
+"""
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "600"))
+
+HASH_DIMENSIONS = 1 << 18
+WORD_WEIGHT = 2.0
+TRIGRAM_WEIGHT = 1.0
+BIGRAM_WEIGHT = 2.0
+
+# Instruction words that do not change what is being asked about
+STOPWORDS = {
+    "a", "an", "the", "of", "on", "in", "for", "and", "or", "is", "are", "was", "what", "whats",
+    "me", "please", "can", "you", "give", "tell", "about", "explain", "explanation", "describe",
+    "description", "define", "definition", "write", "how", "does", "do", "its", "it"
+}
+
+# Words whose presence or position changes the question however similar the rest is
+NEGATION_WORDS = {"not", "no", "non", "without", "never", "except", "with"}
+DIRECTION_WORDS = {"to", "from", "into", "vs", "versus", "than"}
+
+# "+" and "#" stay part of a word: C, C++ and C# are different languages
+_TOKEN_RE = re.compile(r"[a-z0-9]+[+#]*")
+
+
+def _stem(word):
+    if not word[-1].isalnum():
+        return word
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    text = str(text or "").lower().replace("'", "").replace("’", "")
+    return [_stem(t) for t in _TOKEN_RE.findall(text) if t not in STOPWORDS]
+
+
+def _hash(feature):
+    return zlib.crc32(feature.encode("utf-8")) % HASH_DIMENSIONS
+
+
+def bigrams(tokens):
+    return {(a, b) for a, b in zip(tokens, tokens[1:])}
+
+
+def guards(tokens):
+    """What two topics must share exactly, whatever their similarity"""
+    numbers = frozenset(t for t in tokens if any(c.isdigit() for c in t))
+    symbols = frozenset(t for t in tokens if not t[-1].isalnum())
+    negations = frozenset(t for t in tokens if t in NEGATION_WORDS)
+    directions = frozenset(
+        (tokens[i - 1] if i else "", t, tokens[i + 1] if i + 1 < len(tokens) else "")
+        for i, t in enumerate(tokens) if t in DIRECTION_WORDS
+    )
+    return numbers, symbols, negations, directions
+
+
+def vectorize(tokens):
+    """Hashed, L2-normalized sparse vector of word unigrams, word bigrams and character trigrams"""
+    vec = {}
+    for a, b in bigrams(tokens):
+        idx = _hash(f"b:{a} {b}")
+        vec[idx] = vec.get(idx, 0.0) + BIGRAM_WEIGHT
+    for token in tokens:
+        idx = _hash("w:" + token)
+        vec[idx] = vec.get(idx, 0.0) + WORD_WEIGHT
+        padded = f"#{token}#"
+        for i in range(len(padded) - 2):
+            idx = _hash("c:" + padded[i:i + 3])
+            vec[idx] = vec.get(idx, 0.0) + TRIGRAM_WEIGHT
+
+    norm = math.sqrt(sum(v * v for v in vec.values()))
+    if not norm:
+        return {}
+    return {k: v / norm for k, v in vec.items()}
+
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+class _Entry:
+    __slots__ = ("bucket", "tokens", "guards", "vector", "content", "expires_at")
+
+    def __init__(self, bucket, tokens, vector, content, expires_at):
+        self.bucket = bucket
+        self.tokens = set(tokens)
+        self.guards = guards(tokens)
+        self.vector = vector
+        self.content = content
+        self.expires_at = expires_at
+
+
+class SemanticCache:
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl=SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # entry id -> _Entry, least recently used first
+        self._postings = {}             # (bucket, token) -> set of entry ids
+        self._next_id = 0
+        self.lookups = 0
+        self.hits = 0
+        self.inserts = 0
+        self.evictions = 0
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        for token in entry.tokens:
+            ids = self._postings.get((entry.bucket, token))
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._postings[(entry.bucket, token)]
+
+    def lookup(self, bucket, topic):
+        """Return (content, similarity) of the closest cached topic above threshold, else (None, best)"""
+        tokens = tokenize(topic)
+        if not tokens:
+            return None, 0.0
+        vector = vectorize(tokens)
+        required = guards(tokens)
+        now = time.time()
+
+        with self._lock:
+            self.lookups += 1
+            candidates = set()
+            for token in set(tokens):
+                candidates.update(self._postings.get((bucket, token), ()))
+
+            best_id, best_score = None, 0.0
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry.expires_at <= now:
+                    self._remove(entry_id)
+                    self.evictions += 1
+                    continue
+                if entry.guards != required:
+                    continue
+                score = cosine(vector, entry.vector)
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None or best_score < self.threshold:
+                return None, best_score
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id].content, best_score
+
+    def add(self, bucket, topic, content):
+        tokens = tokenize(topic)
+        if not tokens or not content:
+            return
+
+        entry = _Entry(bucket, tokens, vectorize(tokens), content, time.time() + self.ttl)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            for token in entry.tokens:
+                self._postings.setdefault((bucket, token), set()).add(entry_id)
+            self.inserts += 1
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": SEMANTIC_CACHE_ENABLED,
+                "threshold": self.threshold,
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "upstreamCallsSaved": self.hits,
+                "inserts": self.inserts,
+                "evictions": self.evictions,
+                "hitRate": round(self.hits / self.lookups, 4) if self.lookups else 0.0
+            }
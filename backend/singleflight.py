@@ -0,0 +1,76 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+When many requests with the same cache key arrive before the first one has
+populated the cache, only the first (the leader) calls upstream; the others
+(followers) wait for the leader and share its result or its error.
+Coalescing is per worker process - requests landing on different gunicorn
+workers still meet in the shared response cache once the first call finishes.
+"""
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for in-flight request")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, key):
+        """Return (call, is_leader). The leader must call finish() exactly once."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.followers += 1
+                call.followers += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self.leaders += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        if error is not None and not isinstance(error, Exception):
+            # e.g. GeneratorExit when the leader's client disconnects mid-stream
+            error = RuntimeError("In-flight request was cancelled")
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result = result
+        call.error = error
+        call.done.set()
+
+    def do(self, key, fn, timeout=None):
+        """Run fn() once per key across concurrent callers. Returns (result, shared)."""
+        call, leader = self.join(key)
+        if not leader:
+            return call.wait(timeout), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result, False
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        return {"leaders": self.leaders, "followers": self.followers, "inFlight": in_flight}
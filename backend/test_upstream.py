@@ -0,0 +1,153 @@
+import time
+
+from fake_upstream import FakeUpstream
+from hedging import Hedger
+from upstream import ResilientUpstream, CircuitBreaker, UpstreamError, CircuitOpenError
+
+MESSAGES = [{"role": "user", "content": "What is Ohm's law?"}]
+
+
+def make_upstream(fake, **kwargs):
+    sleeps = []
+    upstream = ResilientUpstream(lambda: fake, sleep=sleeps.append, **kwargs)
+    return upstream, sleeps
+
+
+def test_retries_transient_errors_with_backoff():
+    fake = FakeUpstream(script={"large": [503, "connect", "ok"]})
+    upstream, sleeps = make_upstream(fake, max_retries=3)
+
+    response, model = upstream.create(model="large", messages=MESSAGES)
+
+    assert model == "large"
+    assert response.choices[0].message.content.startswith("[large]")
+    assert fake.calls["large"] == 3
+    assert len(sleeps) == 2
+    assert all(0 <= s <= upstream.backoff_max for s in sleeps)
+
+
+def test_gives_up_after_max_retries():
+    fake = FakeUpstream(script={"large": [500] * 10})
+    upstream, sleeps = make_upstream(fake, max_retries=2)
+
+    try:
+        upstream.create(model="large", messages=MESSAGES)
+        assert False, "expected UpstreamError"
+    except UpstreamError as e:
+        assert e.status == 503
+    assert fake.calls["large"] == 3
+
+
+def test_rate_limit_falls_back_to_next_model():
+    fake = FakeUpstream(script={"large": [429]})
+    upstream, sleeps = make_upstream(fake, fallbacks={"large": ["small"]})
+
+    response, model = upstream.create(model="large", messages=MESSAGES)
+
+    assert model == "small"
+    assert sleeps == []
+    assert upstream.stats()["fallbacks"] == 1
+
+
+def test_rate_limit_without_fallback_honours_retry_after():
+    fake = FakeUpstream(script={"large": [429, "ok"]}, retry_after=2)
+    upstream, sleeps = make_upstream(fake)
+
+    _, model = upstream.create(model="large", messages=MESSAGES)
+
+    assert model == "large"
+    assert sleeps and sleeps[0] >= 2
+
+
+def test_fatal_errors_are_not_retried():
+    fake = FakeUpstream(script={"large": [400]})
+    upstream, sleeps = make_upstream(fake, fallbacks={"large": ["small"]})
+
+    try:
+        upstream.create(model="large", messages=MESSAGES)
+        assert False, "expected the original error"
+    except UpstreamError:
+        assert False, "a bad request must not be reported as an outage"
+    except Exception as e:
+        assert getattr(e, "status_code", None) == 400
+    assert fake.calls["large"] == 1 and fake.calls["small"] == 0
+
+
+def test_circuit_breaker_opens_and_fails_fast():
+    now = [0.0]
+    breaker_factory = lambda: CircuitBreaker(threshold=2, reset_timeout=30, clock=lambda: now[0])
+    fake = FakeUpstream(error_rate=1.0, error_status=503, seed=1)
+    upstream, _ = make_upstream(fake, max_retries=1, breaker_factory=breaker_factory)
+
+    try:
+        upstream.create(model="large", messages=MESSAGES)
+    except UpstreamError:
+        pass
+    assert upstream.breaker("large").state == "open"
+
+    calls = fake.calls["large"]
+    try:
+        upstream.create(model="large", messages=MESSAGES)
+        assert False, "expected CircuitOpenError"
+    except CircuitOpenError:
+        pass
+    assert fake.calls["large"] == calls
+
+    # After the reset timeout one probe goes through and closes the breaker
+    now[0] += 31
+    fake.error_rate = 0.0
+    _, model = upstream.create(model="large", messages=MESSAGES)
+    assert model == "large"
+    assert upstream.breaker("large").state == "closed"
+
+
+def test_open_breaker_routes_to_fallback():
+    now = [0.0]
+    breaker_factory = lambda: CircuitBreaker(threshold=1, reset_timeout=30, clock=lambda: now[0])
+    fake = FakeUpstream(script={"large": ["connect"]})
+    upstream, _ = make_upstream(fake, max_retries=0, fallbacks={"large": ["small"]}, breaker_factory=breaker_factory)
+
+    _, model = upstream.create(model="large", messages=MESSAGES)
+    assert model == "small"
+
+    _, model = upstream.create(model="large", messages=MESSAGES)
+    assert model == "small"
+    assert fake.calls["large"] == 1
+    assert upstream.stats()["shortCircuited"] == 1
+
+
+def test_injected_latency():
+    fake = FakeUpstream(latency=0.05)
+    upstream, _ = make_upstream(fake)
+    started = time.perf_counter()
+    upstream.create(model="large", messages=MESSAGES)
+    assert time.perf_counter() - started >= 0.05
+
+
+def test_hedging_cuts_slow_first_tokens():
+    fake = FakeUpstream()
+    hedger = Hedger(enabled=True, percentile=0.9, budget=0.2, min_delay=0.01, min_samples=5)
+
+    def open_stream():
+        # The 11th request stalls before its first token; every other one is fast
+        if fake.calls["large"] == 10:
+            fake.calls["large"] += 1
+            time.sleep(0.5)
+        return fake.create("large", MESSAGES, stream=True)
+
+    for _ in range(10):
+        "".join(chunk.choices[0].delta.content for chunk in hedger.open_stream("large", open_stream))
+
+    started = time.perf_counter()
+    stream = hedger.open_stream("large", open_stream)
+    assert "".join(chunk.choices[0].delta.content for chunk in stream).startswith("[large]")
+    assert time.perf_counter() - started < 0.4
+    stats = hedger.stats()
+    assert stats["hedged"] == 1 and stats["hedgeWins"] == 1
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"{name}: ok")
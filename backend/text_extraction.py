@@ -0,0 +1,184 @@
+"""
+Shared PDF text extraction used by /api/generate, /api/pdf-chat, the PDF store
+and the Streamlit assistant.
+
+Pages are extracted lazily, one at a time, so callers that only need the first
+few thousand characters stop as soon as their character budget is met instead
+of parsing pages they throw away. Every extraction reports per-page timings.
+
+With PDF_EXTRACT_WORKERS > 1, whole-document extraction of large PDFs is split
+into page ranges across a process pool. Pool workers re-import the __main__
+module, so only enable it when the process was started through a cheap entry
+point (gunicorn, the Streamlit runner) - never under `python app.py`, which
+would repeat the app's Mongo/cache/job setup in every worker. The default is
+sequential extraction.
+"""
+import atexit
+import mmap
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+
+import PyPDF2
+
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "1"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+COPY_CHUNK_BYTES = 64 * 1024
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+class PdfLimitError(Exception):
+    pass
+
+
+@contextmanager
+def open_pdf(source):
+    """Open a PDF from raw bytes, a filesystem path (memory-mapped) or a binary stream"""
+    mapped = None
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    elif isinstance(source, str):
+        # PyPDF2 reads whole files into memory when given a path - map it instead
+        with open(source, "rb") as fh:
+            source = mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield PyPDF2.PdfReader(source)
+    finally:
+        if mapped is not None:
+            mapped.close()
+
+
+def iter_pages(reader, start=0, stop=None):
+    """Yield (page_index, text, elapsed_ms) one page at a time"""
+    stop = len(reader.pages) if stop is None else stop
+    for index in range(start, stop):
+        started = time.perf_counter()
+        text = reader.pages[index].extract_text() or ""
+        yield index, text, (time.perf_counter() - started) * 1000
+
+
+def _extract_range(path, start, stop):
+    # Runs in a worker process - re-opens the file rather than shipping parsed objects around
+    with open_pdf(path) as reader:
+        return list(iter_pages(reader, start, stop))
+
+
+def _pool_context():
+    # Never fork the web worker: it runs write-behind, job, hedging and pool threads whose
+    # locks could be held at fork time. forkserver forks from a clean single-threaded server.
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    # Workers only need this module; have the server import it (and PyPDF2) once
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+def _shutdown_pool():
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _get_pool(workers):
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            if _pool_pid is None:
+                atexit.register(_shutdown_pool)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context())
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _extract_parallel(source, page_count, workers):
+    tmp_path = None
+    if isinstance(source, str):
+        path = source
+    else:
+        # Workers need something they can open themselves - hand them a file, not a pickled copy per task
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            if isinstance(source, (bytes, bytearray)):
+                tmp.write(source)
+            else:
+                source.seek(0)
+                shutil.copyfileobj(source, tmp, COPY_CHUNK_BYTES)
+            tmp_path = path = tmp.name
+
+    try:
+        step = -(-page_count // workers)
+        futures = [
+            _get_pool(workers).submit(_extract_range, path, start, min(start + step, page_count))
+            for start in range(0, page_count, step)
+        ]
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+        return pages
+    finally:
+        if tmp_path:
+            os.unlink(tmp_path)
+
+
+def extract_text(source, char_budget=None, workers=None, max_pages=None):
+    """
+    Extract text from a PDF.
+    With a char_budget, pages are read in order and extraction stops once the budget is met;
+    without one, large documents are extracted in parallel page ranges.
+    Raises PdfLimitError before extracting anything if the PDF has more than max_pages pages.
+    Returns a dict with text, page_offsets, page_count, pages_read, truncated, page_ms and elapsed_ms.
+    """
+    started = time.perf_counter()
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    with open_pdf(source) as reader:
+        page_count = len(reader.pages)
+        if max_pages is not None and page_count > max_pages:
+            raise PdfLimitError(f"PDF has {page_count} pages, the limit is {max_pages}")
+
+        if char_budget is None and workers > 1 and page_count >= PDF_PARALLEL_MIN_PAGES:
+            pages = _extract_parallel(source, page_count, workers)
+        else:
+            pages = []
+            used = 0
+            for page in iter_pages(reader):
+                pages.append(page)
+                used += len(page[1]) + 1
+                if char_budget is not None and used >= char_budget:
+                    break
+
+    parts = []
+    page_offsets = []
+    position = 0
+    for _, text, _ in pages:
+        page_offsets.append(position)
+        parts.append(text)
+        parts.append("\n")
+        position += len(text) + 1
+
+    return {
+        "text": "".join(parts),
+        "page_offsets": page_offsets,
+        "page_count": page_count,
+        "pages_read": len(pages),
+        "truncated": len(pages) < page_count,
+        "page_ms": [round(ms, 2) for _, _, ms in pages],
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+
+def describe_timings(result):
+    """One-line summary of an extraction for the logs"""
+    slowest = max(range(len(result["page_ms"])), key=result["page_ms"].__getitem__, default=None)
+    summary = f"{result['pages_read']}/{result['page_count']} pages, {len(result['text'])} chars in {result['elapsed_ms']}ms"
+    if slowest is not None:
+        summary += f" (slowest page {slowest + 1}: {result['page_ms'][slowest]}ms)"
+    return summary
@@ -0,0 +1,240 @@
+"""
+Token budgets for generation requests.
+
+Every content type gets a completion budget sized to what it actually asks
+for (a 2-3 line summary does not need the 8192 tokens of project
+documentation), scaled by mode and clipped to what is left of the model's
+context window once the system prompt and question are counted. File context
+is cut by tokens instead of characters. Counting uses tiktoken when it is
+installed and a ~4 characters/token heuristic otherwise; estimates are
+compared with the usage the upstream reports so drift stays visible.
+
+tiktoken downloads its vocabulary on first use, which must never happen on a
+request. The encoding is loaded on a background thread from TIKTOKEN_CACHE_DIR
+(backend/cache/tiktoken by default) and the heuristic is used until it is
+ready. That load fetches the vocabulary if it is not cached; pre-cache it at
+build time with
+
+    python token_budget.py --download
+
+and set TOKENIZER_DOWNLOAD=false on hosts without outbound network access.
+"""
+import hashlib
+import os
+import sys
+import threading
+
+os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.join(os.path.dirname(__file__), "cache", "tiktoken"))
+
+# Optional tokenizer - the heuristic below is used when it is missing
+try:
+    import tiktoken
+    _HAS_TIKTOKEN = True
+except Exception:
+    _HAS_TIKTOKEN = False
+
+ENCODING_NAME = "cl100k_base"
+ENCODING_URL = "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken"
+TOKENIZER_DOWNLOAD = os.getenv("TOKENIZER_DOWNLOAD", "true").lower() == "true"
+
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "32768"))
+FILE_CONTEXT_TOKENS = int(os.getenv("FILE_CONTEXT_TOKENS", "1000"))
+# Slack for chat-format overhead and tokenizer mismatch (tiktoken is not the Llama tokenizer)
+PROMPT_SAFETY_TOKENS = 256
+CHARS_PER_TOKEN = 4
+
+# Completion budget in standard mode
+CONTENT_TYPE_MAX_TOKENS = {
+    "Explanation": 2048,
+    "Summary": 512,
+    "Lab Report": 4096,
+    "Viva Preparation": 3072,
+    "Revision Notes": 4096,
+    "Assignment": 4096,
+    "Formula Sheet": 3072,
+    "Quiz": 3072,
+    "Coding": 4096,
+    "Debugging": 3072,
+    "Algorithm Breakdown": 3072,
+    "Project Documentation": 8192,
+    "Project Ideas": 2048,
+    "Research Paper": 8192,
+    "Interview Q&A": 4096,
+    "Aptitude Practice": 4096,
+    "Paper Simplifier": 2048,
+    "Roadmap Generator": 3072,
+    "Article/Blog": 3072,
+    "Story Writing": 3072,
+    "Social Media Script": 1024,
+    "Poetry/Lyrics": 1024,
+    "Creative Essay": 3072,
+    "Motivation of Goals": 512
+}
+DEFAULT_MAX_TOKENS = 2048
+
+# (completion multiplier, completion cap, file context multiplier) per mode
+MODE_BUDGETS = {
+    "standard": (1.0, 8192, 1.0),
+    "telescope": (0.25, 512, 0.5),
+    "deep": (2.0, 8192, 2.0),
+    "thinking": (2.0, 8192, 2.0)
+}
+
+_encoding = None
+_encoding_loading = False
+_encoding_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "estimatedPromptTokens": 0, "actualPromptTokens": 0,
+          "completionTokens": 0, "reservedCompletionTokens": 0}
+
+
+def _encoding_cached():
+    # tiktoken stores each vocabulary file under the sha1 of its URL
+    path = os.path.join(os.environ["TIKTOKEN_CACHE_DIR"], hashlib.sha1(ENCODING_URL.encode()).hexdigest())
+    return os.path.exists(path)
+
+
+def load_encoding(download=TOKENIZER_DOWNLOAD):
+    """Load the tiktoken encoding (blocking); only touches the network when `download` is set"""
+    global _encoding
+    if not download and not _encoding_cached():
+        print(f"WARNING: tiktoken vocabulary not cached in {os.environ['TIKTOKEN_CACHE_DIR']}, "
+              "estimating tokens from length (run `python token_budget.py --download`)")
+        return None
+    try:
+        encoding = tiktoken.get_encoding(ENCODING_NAME)
+    except Exception as e:
+        print(f"WARNING: tiktoken unavailable, estimating tokens from length ({e})")
+        return None
+    _encoding = encoding
+    return encoding
+
+
+def _get_encoding():
+    # Never blocks: the first call starts the load in the background, the heuristic covers until then
+    global _encoding_loading
+    if _encoding is not None or not _HAS_TIKTOKEN:
+        return _encoding
+    with _encoding_lock:
+        if not _encoding_loading:
+            _encoding_loading = True
+            threading.Thread(target=load_encoding, name="tiktoken-load", daemon=True).start()
+    return None
+
+
+def tokenizer_name():
+    return f"tiktoken/{ENCODING_NAME}" if _get_encoding() else "heuristic"
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    # ~4 characters per token for English text
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chars_for_tokens(tokens):
+    """Generous character count that holds at least `tokens` tokens, for lazy extraction"""
+    return tokens * CHARS_PER_TOKEN * 2
+
+
+def truncate_to_tokens(text, budget):
+    """Cut text to at most `budget` tokens"""
+    if budget <= 0 or not text:
+        return ""
+    encoding = _get_encoding()
+    if encoding:
+        ids = encoding.encode(text, disallowed_special=())
+        return text if len(ids) <= budget else encoding.decode(ids[:budget])
+    limit = budget * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > limit // 2 else limit]
+
+
+def file_context_tokens(mode):
+    """Tokens of uploaded-file context to send for a mode"""
+    _, _, context_scale = MODE_BUDGETS.get(mode, MODE_BUDGETS["standard"])
+    return int(FILE_CONTEXT_TOKENS * context_scale)
+
+
+def completion_budget(content_type, mode="standard"):
+    scale, cap, _ = MODE_BUDGETS.get(mode, MODE_BUDGETS["standard"])
+    base = CONTENT_TYPE_MAX_TOKENS.get(content_type, DEFAULT_MAX_TOKENS)
+    return max(min(int(base * scale), cap), 128)
+
+
+def plan_request(messages, content_type, mode="standard"):
+    """
+    Size the completion for a chat request.
+    Returns a dict with prompt_tokens (estimated) and max_tokens - the content type's
+    budget for the mode, clipped to what fits in the context window.
+    """
+    prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+    room = LLM_CONTEXT_TOKENS - prompt_tokens - PROMPT_SAFETY_TOKENS
+    return {
+        "prompt_tokens": prompt_tokens,
+        "max_tokens": max(min(completion_budget(content_type, mode), room), 1)
+    }
+
+
+def usage_from(response):
+    """Token usage reported by the upstream (completion or final stream chunk), if any"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        # Groq reports streaming usage on the last chunk under x_groq
+        usage = getattr(getattr(response, "x_groq", None), "usage", None)
+    if usage is None:
+        return None
+    return {
+        "prompt": getattr(usage, "prompt_tokens", None),
+        "completion": getattr(usage, "completion_tokens", None),
+        "total": getattr(usage, "total_tokens", None)
+    }
+
+
+def token_report(plan, usage=None):
+    """Estimated vs. actual tokens for one request, as stored in history"""
+    report = {"estimated_prompt": plan["prompt_tokens"], "max_tokens": plan["max_tokens"]}
+    if usage:
+        report.update(usage)
+        with _stats_lock:
+            _stats["requests"] += 1
+            _stats["estimatedPromptTokens"] += plan["prompt_tokens"]
+            _stats["actualPromptTokens"] += usage.get("prompt") or 0
+            _stats["completionTokens"] += usage.get("completion") or 0
+            _stats["reservedCompletionTokens"] += plan["max_tokens"]
+    return report
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot["tokenizer"] = tokenizer_name()
+    if snapshot["actualPromptTokens"]:
+        snapshot["estimateRatio"] = round(snapshot["estimatedPromptTokens"] / snapshot["actualPromptTokens"], 3)
+    if snapshot["reservedCompletionTokens"]:
+        snapshot["completionUtilization"] = round(snapshot["completionTokens"] / snapshot["reservedCompletionTokens"], 3)
+    return snapshot
+
+
+def main(argv):
+    if "--download" not in argv:
+        print("usage: python token_budget.py --download")
+        return 2
+    if not _HAS_TIKTOKEN:
+        print("tiktoken is not installed")
+        return 1
+    if load_encoding(download=True) is None:
+        return 1
+    print(f"Cached {ENCODING_NAME} in {os.environ['TIKTOKEN_CACHE_DIR']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
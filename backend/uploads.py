@@ -0,0 +1,216 @@
+"""
+Bounded-memory handling of uploaded files.
+
+Uploads used to be read whole with file.read() and wrapped in BytesIO, so a few
+concurrent 50 MB PDFs could push a worker past its memory limit. SpooledUpload
+keeps small uploads in memory and anything larger on disk: Werkzeug already
+spools big request bodies to a temporary file, which is memory-mapped directly;
+other streams are copied in chunks into a SpooledTemporaryFile that rolls over
+to disk past UPLOAD_SPOOL_BYTES. Size and page limits are enforced before any
+parsing happens.
+
+Each upload reports the most bytes it held in memory at once, and PeakMemory
+how far handling it raised the worker's peak resident set; both feed stats()
+for /api/admin/cache-stats.
+"""
+import hashlib
+import mmap
+import os
+import sys
+import tempfile
+import threading
+from io import BytesIO
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from text_extraction import extract_text, PdfLimitError
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+MAX_UPLOAD_PAGES = int(os.getenv("MAX_UPLOAD_PAGES", "500"))
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(4 * 1024 * 1024)))
+COPY_CHUNK_BYTES = 64 * 1024
+
+_stats_lock = threading.Lock()
+_stats = {"uploads": 0, "onDisk": 0, "rejected": 0, "maxUploadBytes": 0,
+          "maxInMemoryBytes": 0, "maxPeakRssGrowthBytes": 0, "peakRssGrowthBytes": 0}
+
+
+class UploadRejected(Exception):
+    pass
+
+
+def _disk_fileno(stream):
+    """File descriptor of a stream that already lives on disk, else None"""
+    if isinstance(stream, BytesIO):
+        return None
+    if isinstance(stream, tempfile.SpooledTemporaryFile) and not stream._rolled:
+        return None
+    try:
+        return stream.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class SpooledUpload:
+    """
+    Size-capped view of an uploaded file. Use as a context manager:
+
+        with SpooledUpload(request.files['file']) as upload:
+            extraction = upload.extract_pdf(char_budget=4000)
+    """
+
+    def __init__(self, file, max_bytes=MAX_UPLOAD_BYTES):
+        self.filename = file.filename or ""
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.sha256 = ""
+        self.on_disk = False
+        self.peak_in_memory_bytes = 0
+        self._recorded = False
+        self._data = b""
+        self._mmap = None
+        self._spool = None
+        try:
+            self._load(file.stream)
+        except UploadRejected:
+            with _stats_lock:
+                _stats["rejected"] += 1
+            self._recorded = True
+            self.close()
+            raise
+        except Exception:
+            self.close()
+            raise
+
+    def _load(self, stream):
+        fileno = _disk_fileno(stream)
+        if fileno is None:
+            fileno = self._spool_stream(stream)
+        if fileno is None:
+            self.sha256 = hashlib.sha256(self._data).hexdigest()
+            return
+
+        self.size = os.fstat(fileno).st_size
+        if self.size > self.max_bytes:
+            raise UploadRejected(f"File is larger than the {self.max_bytes // (1024 * 1024)} MB upload limit")
+        if self.size:
+            self._mmap = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+            self.sha256 = hashlib.sha256(self._mmap).hexdigest()
+        else:
+            self.sha256 = hashlib.sha256(b"").hexdigest()
+        self.on_disk = True
+
+    def _spool_stream(self, stream):
+        """Copy a stream in chunks; returns a file descriptor if it rolled over to disk"""
+        spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+        self._spool = spool
+        while True:
+            chunk = stream.read(COPY_CHUNK_BYTES)
+            if not chunk:
+                break
+            self.size += len(chunk)
+            if self.size > self.max_bytes:
+                raise UploadRejected(f"File is larger than the {self.max_bytes // (1024 * 1024)} MB upload limit")
+            spool.write(chunk)
+            if not spool._rolled:
+                self.peak_in_memory_bytes = max(self.peak_in_memory_bytes, self.size)
+        spool.flush()
+
+        if spool._rolled:
+            return spool.fileno()
+        spool.seek(0)
+        self._data = spool.read()
+        # The spool's buffer and the copy coexist until the spool is closed
+        self.peak_in_memory_bytes = max(self.peak_in_memory_bytes, 2 * len(self._data))
+        spool.close()
+        self._spool = None
+        return None
+
+    @property
+    def source(self):
+        """Something text_extraction can parse without another full copy in memory"""
+        return self._mmap if self._mmap is not None else self._data
+
+    def read_bytes(self):
+        return bytes(self.source)
+
+    def extract_pdf(self, char_budget=None):
+        try:
+            return extract_text(self.source, char_budget=char_budget, max_pages=MAX_UPLOAD_PAGES)
+        except PdfLimitError as le:
+            raise UploadRejected(str(le))
+
+    def stats(self):
+        return {"size": self.size, "on_disk": self.on_disk, "in_memory_bytes": len(self._data),
+                "peak_in_memory_bytes": self.peak_in_memory_bytes}
+
+    def close(self):
+        if not self._recorded:
+            self._recorded = True
+            with _stats_lock:
+                _stats["uploads"] += 1
+                _stats["onDisk"] += self.on_disk
+                _stats["maxUploadBytes"] = max(_stats["maxUploadBytes"], self.size)
+                _stats["maxInMemoryBytes"] = max(_stats["maxInMemoryBytes"], self.peak_in_memory_bytes)
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def _max_rss_bytes():
+    """Peak resident set size of this process so far, else None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakMemory:
+    """
+    Measures how far handling one upload raised the worker's peak resident set
+    (ru_maxrss). 0 means the request stayed under the worker's earlier peak; when
+    requests overlap, the growth is charged to whichever one finishes the climb.
+    """
+
+    def __init__(self):
+        self.peak_rss_growth_bytes = None
+        self._start = None
+
+    def __enter__(self):
+        self._start = _max_rss_bytes()
+        return self
+
+    def __exit__(self, *exc):
+        end = _max_rss_bytes()
+        if self._start is not None and end is not None:
+            self.peak_rss_growth_bytes = end - self._start
+            with _stats_lock:
+                _stats["peakRssGrowthBytes"] += self.peak_rss_growth_bytes
+                _stats["maxPeakRssGrowthBytes"] = max(_stats["maxPeakRssGrowthBytes"], self.peak_rss_growth_bytes)
+        return False
+
+    def stats(self):
+        return {"peak_rss_growth_bytes": self.peak_rss_growth_bytes}
+
+
+def stats():
+    """Upload counters and memory high-water marks for this worker"""
+    with _stats_lock:
+        report = dict(_stats)
+    report["maxRssBytes"] = _max_rss_bytes()
+    report["spoolBytes"] = UPLOAD_SPOOL_BYTES
+    return report
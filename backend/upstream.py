@@ -0,0 +1,235 @@
+"""
+Resilient wrapper around upstream chat completion calls.
+
+Transient failures (connection errors, timeouts, 5xx) are retried with
+jittered exponential backoff inside a bounded time budget. Each model has a
+circuit breaker: after UPSTREAM_BREAKER_THRESHOLD consecutive failures it
+opens and calls fail fast until UPSTREAM_BREAKER_RESET seconds have passed,
+when a single probe is let through. A rate-limited (429) or short-circuited
+model falls through to the next model in its fallback chain. Errors that
+retrying cannot fix (bad request, auth) are raised unchanged.
+
+The client is obtained from a factory on every call, so tests can swap in
+fake_upstream.FakeUpstream for the Groq client.
+"""
+import os
+import random
+import threading
+import time
+
+import httpx
+
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "8"))
+# Upper bound on time spent sleeping between attempts for one request
+UPSTREAM_RETRY_BUDGET = float(os.getenv("UPSTREAM_RETRY_BUDGET", "15"))
+UPSTREAM_BREAKER_THRESHOLD = int(os.getenv("UPSTREAM_BREAKER_THRESHOLD", "5"))
+UPSTREAM_BREAKER_RESET = float(os.getenv("UPSTREAM_BREAKER_RESET", "30"))
+
+RATE_LIMITED = "rate_limited"
+RETRYABLE = "retryable"
+FATAL = "fatal"
+
+_RETRYABLE_NAMES = {"APIConnectionError", "APITimeoutError"}
+
+
+class UpstreamError(Exception):
+    """Upstream unavailable after retries and fallbacks; carries the HTTP status to return"""
+
+    def __init__(self, message, status=503, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+def classify(error):
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        return RATE_LIMITED
+    if status in (408, 409) or (status is not None and status >= 500):
+        return RETRYABLE
+    if isinstance(error, (httpx.TransportError, TimeoutError, ConnectionError)) or type(error).__name__ in _RETRYABLE_NAMES:
+        return RETRYABLE
+    return FATAL
+
+
+def retry_after_seconds(error):
+    """Retry-After from an upstream error response, in seconds, if present"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        value = headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one probe) -> closed"""
+
+    def __init__(self, threshold=UPSTREAM_BREAKER_THRESHOLD, reset_timeout=UPSTREAM_BREAKER_RESET, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                if self.opened_at is None or self._probing:
+                    self.times_opened += 1
+                self.opened_at = self.clock()
+            self._probing = False
+
+    def stats(self):
+        return {"state": self.state, "consecutiveFailures": self.failures, "timesOpened": self.times_opened}
+
+
+class ResilientUpstream:
+    """chat.completions.create with retries, per-model circuit breakers and model fallback"""
+
+    def __init__(self, client_factory, fallbacks=None, max_retries=UPSTREAM_MAX_RETRIES,
+                 backoff_base=UPSTREAM_BACKOFF_BASE, backoff_max=UPSTREAM_BACKOFF_MAX,
+                 retry_budget=UPSTREAM_RETRY_BUDGET, breaker_factory=CircuitBreaker, sleep=time.sleep):
+        self.client_factory = client_factory
+        self.fallbacks = fallbacks or {}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_budget = retry_budget
+        self.breaker_factory = breaker_factory
+        self.sleep = sleep
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "succeeded": 0, "retries": 0, "rateLimited": 0,
+                          "fallbacks": 0, "shortCircuited": 0, "failed": 0}
+
+    def breaker(self, model):
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = self.breaker_factory()
+            return self._breakers[model]
+
+    def chain(self, model):
+        return [model] + [m for m in self.fallbacks.get(model, []) if m != model]
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, never shorter than the upstream's Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def create(self, **request):
+        """
+        Perform the completion and return (response, model_used).
+        Raises UpstreamError when every model in the chain is unavailable.
+        """
+        self._count("calls")
+        requested = request["model"]
+        models = self.chain(requested)
+        deadline = time.monotonic() + self.retry_budget
+        last_error = None
+
+        for position, model in enumerate(models):
+            has_fallback = position < len(models) - 1
+            breaker = self.breaker(model)
+            attempt = 0
+            while True:
+                if not breaker.allow():
+                    self._count("shortCircuited")
+                    last_error = CircuitOpenError(f"Upstream model {model} is temporarily unavailable",
+                                                  retry_after=breaker.reset_timeout)
+                    break
+
+                try:
+                    response = self.client_factory().chat.completions.create(**{**request, "model": model})
+                except Exception as e:
+                    kind = classify(e)
+                    if kind == FATAL:
+                        # The upstream answered - it is healthy, the request is not
+                        breaker.record_success()
+                        raise
+                    last_error = e
+                    if kind == RATE_LIMITED:
+                        self._count("rateLimited")
+                        breaker.record_success()
+                        if has_fallback:
+                            break
+                    else:
+                        breaker.record_failure()
+
+                    delay = self.backoff(attempt, retry_after_seconds(e))
+                    if attempt >= self.max_retries or time.monotonic() + delay > deadline:
+                        break
+                    print(f"DEBUG: Upstream {model} {kind} ({e}); retry {attempt + 1} in {delay:.2f}s")
+                    self._count("retries")
+                    self.sleep(delay)
+                    attempt += 1
+                    continue
+
+                breaker.record_success()
+                self._count("succeeded")
+                if model != requested:
+                    self._count("fallbacks")
+                    print(f"DEBUG: Fell back from {requested} to {model}")
+                return response, model
+
+            if has_fallback:
+                print(f"DEBUG: Upstream {model} unavailable ({last_error}), trying {models[position + 1]}")
+
+        self._count("failed")
+        raise self._as_upstream_error(last_error)
+
+    def _as_upstream_error(self, error):
+        if isinstance(error, UpstreamError):
+            return error
+        if classify(error) == RATE_LIMITED:
+            return UpstreamError("The AI service is busy, please try again shortly.", status=429,
+                                 retry_after=retry_after_seconds(error) or UPSTREAM_BACKOFF_MAX)
+        return UpstreamError(f"The AI service is unavailable: {error}", status=503,
+                             retry_after=UPSTREAM_BREAKER_RESET)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            breakers = {model: b.stats() for model, b in self._breakers.items()}
+        return {**counters, "breakers": breakers, "fallbackChains": self.fallbacks}
@@ -0,0 +1,138 @@
+"""
+User lookup by id or email, shared by every route that takes a `user_id`.
+
+The frontend sends either the user's ObjectId hex string or their email, so
+every request used to start with a `db.users.find_one` round-trip. Resolved
+users are kept in an in-process LRU for USER_CACHE_TTL seconds under both keys
+(id and email), so a returning user is found without touching Mongo. Routes
+that change a user (signup, password change) call `invalidate()`; changes made
+by another worker are picked up when the entry expires.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+
+def parse_object_id(value):
+    """ObjectId for a 24-character hex string, otherwise None"""
+    value = str(value)
+    if len(value) == 24 and all(c in '0123456789abcdef' for c in value.lower()):
+        return ObjectId(value)
+    return None
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+
+class UserResolver:
+    def __init__(self, db, ttl=USER_CACHE_TTL, max_entries=USER_CACHE_MAX_ENTRIES, clock=time.monotonic, on_create=None):
+        self.db = db
+        self.on_create = on_create
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    @staticmethod
+    def _keys(user):
+        keys = [f"id:{user['_id']}"]
+        if user.get("email"):
+            keys.append(f"email:{user['email']}")
+        return keys
+
+    @staticmethod
+    def _lookup_key(user_id_raw):
+        u_id = parse_object_id(user_id_raw)
+        return f"id:{u_id}" if u_id else f"email:{user_id_raw}"
+
+    def _get_cached(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+            self._counters["misses"] += 1
+            return None
+
+    def _store(self, user):
+        expires = self.clock() + self.ttl
+        with self._lock:
+            for key in self._keys(user):
+                self._entries[key] = (expires, user)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def resolve(self, user_id_raw, create=False):
+        """
+        Return the user for an id or email, or None.
+        With `create`, an unknown email gets an email-only user (first use from the generator).
+        """
+        if not user_id_raw:
+            return None
+        user = self._get_cached(self._lookup_key(user_id_raw))
+        if user is not None:
+            return user
+        if self.db is None:
+            raise DatabaseUnavailable("The database is unavailable, please try again later.")
+
+        u_id = parse_object_id(user_id_raw)
+        user = self.db.users.find_one({"_id": u_id}) if u_id else self.db.users.find_one({"email": user_id_raw})
+
+        if not user and create and "@" in str(user_id_raw):
+            now = datetime.now(timezone.utc)
+            try:
+                self.db.users.insert_one({
+                    "username": str(user_id_raw).split("@")[0], "email": str(user_id_raw),
+                    "created_at": now, "credits_last_reset": now
+                })
+                if self.on_create:
+                    self.on_create(now)
+            except DuplicateKeyError:
+                pass  # another request created the user first
+            user = self.db.users.find_one({"email": user_id_raw})
+
+        if user:
+            self._store(user)
+        return user
+
+    def invalidate(self, user=None, email=None):
+        """Drop a user (document or email) from the cache after it changed"""
+        keys = self._keys(user) if user else []
+        if email:
+            keys.append(f"email:{email}")
+        with self._lock:
+            for key in keys:
+                entry = self._entries.pop(key, None)
+                # The same document is also cached under its other key
+                if entry:
+                    for other in self._keys(entry[1]):
+                        self._entries.pop(other, None)
+            self._counters["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "entries": entries,
+            "hitRate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "ttlSeconds": self.ttl
+        }
@@ -0,0 +1,254 @@
+"""
+Write-behind queue for append-only collections (history, logins).
+
+`add()` gives the document an _id and queues it in memory; the route returns
+without waiting for Mongo. A background thread writes the queue with one
+`insert_many` per collection once WRITE_BEHIND_BATCH documents are waiting or
+WRITE_BEHIND_INTERVAL seconds have passed, and the queue is flushed at
+interpreter exit.
+
+When a batch cannot be written (Mongo unreachable), its documents are appended
+to a per-process journal file in WRITE_BEHIND_JOURNAL_DIR (bson.json_util
+lines) and replayed by whichever process flushes next. Documents keep their
+_id, so a batch that was partly written before failing is not duplicated on
+replay. A journal claimed for replay by a process that died before finishing
+(`.replay-<pid>` with no such process) is picked up again.
+
+`on_write(events)` is called with the (collection, doc) pairs that were
+actually inserted by each flush - rollups.py keeps its counters current this way.
+"""
+import atexit
+import glob
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "100"))
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "0.5"))
+WRITE_BEHIND_JOURNAL_DIR = os.getenv("WRITE_BEHIND_JOURNAL_DIR", os.path.join(os.path.dirname(__file__), "cache", "write_behind"))
+FLUSH_WINDOW = 500
+DUPLICATE_KEY = 11000
+_CLAIMED_RE = re.compile(r"^(.*\.jsonl)\.replay-(\d+)$")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by someone else
+    return True
+
+
+def _only_duplicates(error):
+    """A replayed document that already made it to Mongo is not a failure"""
+    details = error.details or {}
+    return not details.get("writeConcernErrors") and all(e.get("code") == DUPLICATE_KEY for e in details.get("writeErrors", []))
+
+
+class WriteBehind:
+    def __init__(self, db, enabled=WRITE_BEHIND_ENABLED, batch_size=WRITE_BEHIND_BATCH,
+                 interval=WRITE_BEHIND_INTERVAL, journal_dir=WRITE_BEHIND_JOURNAL_DIR, on_write=None):
+        self.db = db
+        self.on_write = on_write
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.interval = interval
+        self.journal_dir = journal_dir
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._thread_pid = None
+        self._closed = False
+        self._flush_ms = deque(maxlen=FLUSH_WINDOW)
+        self._counters = {"queued": 0, "written": 0, "batches": 0, "journaled": 0, "replayed": 0, "flushErrors": 0}
+        if enabled:
+            atexit.register(self.close)
+
+    def _journal_path(self):
+        return os.path.join(self.journal_dir, f"journal-{os.getpid()}.jsonl")
+
+    def _ensure_thread(self):
+        # The flusher thread does not survive a fork - start one per process
+        if self._thread_pid != os.getpid():
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._run, name="write-behind", daemon=True).start()
+
+    def add(self, collection, doc):
+        """Queue `doc` for insertion into `collection` (inserted immediately when disabled)"""
+        doc.setdefault("_id", ObjectId())
+        if not self.enabled:
+            self.db[collection].insert_one(doc)
+            self._notify_written([(collection, doc)])
+            return
+        with self._cond:
+            self._ensure_thread()
+            self._pending.append((collection, doc))
+            self._counters["queued"] += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def pending(self, collection, **match):
+        """Queued documents of `collection` whose fields equal `match` (for read-your-writes)"""
+        with self._cond:
+            return [dict(doc) for name, doc in self._pending
+                    if name == collection and all(doc.get(k) == v for k, v in match.items())]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._pending) < self.batch_size:
+                    self._cond.wait(self.interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"ERROR: Write-behind flush failed: {e}")
+
+    def _notify_written(self, events):
+        if self.on_write and events:
+            try:
+                self.on_write(events)
+            except Exception as e:
+                # The documents are stored; only the derived data is behind
+                print(f"ERROR: Write-behind on_write hook failed: {e}")
+
+    def _insert(self, collection, docs):
+        """insert_many; returns the documents that were newly inserted"""
+        try:
+            self.db[collection].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            if not _only_duplicates(e):
+                raise
+            skipped = {error["index"] for error in e.details.get("writeErrors", [])}
+            return [doc for i, doc in enumerate(docs) if i not in skipped]
+        return docs
+
+    def _write_journal(self, batch, count=True):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        with open(self._journal_path(), "a", encoding="utf-8") as f:
+            for collection, doc in batch:
+                f.write(json_util.dumps({"collection": collection, "doc": doc}) + "\n")
+        if count:
+            with self._cond:
+                self._counters["journaled"] += len(batch)
+
+    def _replayable_journals(self):
+        """(path, journal name) for every journal waiting to be replayed, including stranded claims"""
+        found = [(path, path) for path in glob.glob(os.path.join(self.journal_dir, "journal-*.jsonl"))]
+        for path in glob.glob(os.path.join(self.journal_dir, "journal-*.jsonl.replay-*")):
+            match = _CLAIMED_RE.match(path)
+            if match and int(match.group(2)) != os.getpid() and not _pid_alive(int(match.group(2))):
+                found.append((path, match.group(1)))
+        return found
+
+    def _read_journal(self, path):
+        entries = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json_util.loads(line))
+                except ValueError:
+                    # A line cut short when its writer died mid-append
+                    print(f"ERROR: Skipping unreadable write-behind journal line in {path}")
+        return entries
+
+    def _replay_journals(self):
+        """Write back documents journaled by any process; raises if they still cannot be written"""
+        for path, name in self._replayable_journals():
+            claimed = f"{name}.replay-{os.getpid()}"
+            try:
+                # Only one process wins the rename
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            entries = self._read_journal(claimed)
+            try:
+                self._write_batch([(e["collection"], e["doc"]) for e in entries])
+            except Exception:
+                self._write_journal([(e["collection"], e["doc"]) for e in entries], count=False)
+                os.remove(claimed)
+                raise
+            os.remove(claimed)
+            with self._cond:
+                self._counters["replayed"] += len(entries)
+
+    def _write_batch(self, batch):
+        by_collection = {}
+        for collection, doc in batch:
+            by_collection.setdefault(collection, []).append(doc)
+        for collection, docs in by_collection.items():
+            self._notify_written([(collection, doc) for doc in self._insert(collection, docs)])
+
+    def flush(self):
+        """Write everything queued so far; on failure the batch goes to the journal"""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if not batch and not os.path.isdir(self.journal_dir):
+                return
+
+            started = time.perf_counter()
+            try:
+                self._replay_journals()
+                if batch:
+                    self._write_batch(batch)
+            except Exception as e:
+                # Whatever failed, the popped batch exists nowhere else - journal it
+                print(f"ERROR: Write-behind flush failed ({len(batch)} documents journaled): {e}")
+                with self._cond:
+                    self._counters["flushErrors"] += 1
+                if batch:
+                    self._write_journal(batch)
+                return
+
+            with self._cond:
+                if batch:
+                    self._counters["written"] += len(batch)
+                    self._counters["batches"] += 1
+                    self._flush_ms.append((time.perf_counter() - started) * 1000)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.flush()
+
+    def _journal_depth(self):
+        depth = 0
+        for path in glob.glob(os.path.join(self.journal_dir, "journal-*.jsonl*")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    depth += sum(1 for _ in f)
+            except OSError:
+                pass
+        return depth
+
+    def stats(self):
+        with self._cond:
+            report = {
+                **self._counters,
+                "enabled": self.enabled,
+                "queueDepth": len(self._pending),
+                "batchSize": self.batch_size,
+                "intervalSeconds": self.interval
+            }
+            flushes = sorted(self._flush_ms)
+        report["journalDepth"] = self._journal_depth()
+        if flushes:
+            report["flushMs"] = {
+                "p50": round(flushes[len(flushes) // 2], 1),
+                "p95": round(flushes[min(int(len(flushes) * 0.95), len(flushes) - 1)], 1),
+                "max": round(flushes[-1], 1)
+            }
+        return report
@@ -162,38 +162,15 @@ const Dashboard = ({ user, onLogout }) => {
         }
     }, [user]);
 
-    const fetchAdminStats = async () => {
+    const fetchAdminStats = async (refresh = false) => {
         if (!user || !user.email) return;
         try {
-            const [statsRes, summaryRes, dauRes, newUsersRes, promptsRes, tokensRes, featureRes, stickinessRes, retentionRes, responseTimeRes, errorRateRes, avgPromptsRes] = await Promise.all([
-                api.get(`/api/admin/stats?admin_email=${user.email}&days=${timeRange}`),
-                api.get(`/api/admin/summary?admin_email=${user.email}`),
-                api.get(`/api/admin/dau?admin_email=${user.email}&days=${timeRange}`),
-                api.get(`/api/admin/new-users?admin_email=${user.email}&days=${timeRange}`),
-                api.get(`/api/admin/prompts-per-day?admin_email=${user.email}&days=${timeRange}`),
-                api.get(`/api/admin/token-usage?admin_email=${user.email}&days=${timeRange}`),
-                api.get(`/api/admin/feature-usage?admin_email=${user.email}`),
-                api.get(`/api/admin/stickiness?admin_email=${user.email}`),
-                api.get(`/api/admin/retention?admin_email=${user.email}&days=${timeRange}`),
-                api.get(`/api/admin/response-time?admin_email=${user.email}&days=${timeRange}`),
-                api.get(`/api/admin/error-rate?admin_email=${user.email}&days=${timeRange}`),
-                api.get(`/api/admin/avg-prompts?admin_email=${user.email}&days=${timeRange}`)
-            ]);
-
-            setAdminStats({
-                daily: statsRes.data.daily_stats,
-                dau: dauRes.data,
-                newUsers: newUsersRes.data,
-                prompts: promptsRes.data,
-                tokens: tokensRes.data,
-                features: featureRes.data,
-                stickiness: stickinessRes.data,
-                retention: retentionRes.data,
-                responseTime: responseTimeRes.data,
-                errorRate: errorRateRes.data,
-                avgPrompts: avgPromptsRes.data
-            });
-            setAdminSummary(summaryRes.data);
+            // One request for every chart; the backend caches it briefly (pass refresh to recompute now)
+            const { data } = await api.get(`/api/admin/dashboard?admin_email=${user.email}&days=${timeRange}${refresh ? '&refresh=1' : ''}`);
+            const { summary, ...stats } = data;
+
+            setAdminStats(stats);
+            setAdminSummary(summary);
         } catch (error) {
             console.error('Error fetching admin data:', error);
         }
@@ -270,7 +247,12 @@ const Dashboard = ({ user, onLogout }) => {
             // Handle PDF chat if PDF is selected
             if (selectedPdfForChat) {
                 const formData = new FormData();
-                formData.append('file', selectedPdfForChat.file);
+                // Reuse the stored document when it was already ingested
+                if (selectedPdfForChat.docId) {
+                    formData.append('doc_id', selectedPdfForChat.docId);
+                } else {
+                    formData.append('file', selectedPdfForChat.file);
+                }
                 formData.append('question', currentInput);
                 formData.append('user_id', user.id || user.email);
 
@@ -280,6 +262,10 @@ const Dashboard = ({ user, onLogout }) => {
                     headers: { 'Content-Type': 'multipart/form-data' }
                 });
 
+                if (response.data.doc_id && !selectedPdfForChat.docId) {
+                    setSelectedPdfForChat(prev => prev ? { ...prev, docId: response.data.doc_id } : prev);
+                }
+
                 if (response.data.content) {
                     const aiMsgId = Date.now() + 1;
                     const aiMsg = {
@@ -312,44 +298,64 @@ const Dashboard = ({ user, onLogout }) => {
                     fetchHistory();
                 }
             } else {
-                // Standard generation for non-PDF mode
-                const response = await api.post('/api/generate', {
-                    topic: currentInput,
-                    content_type: currentType,
-                    user_id: user.id || user.email,
-                    mode: aiMode
+                // Standard generation for non-PDF mode - streamed token by token
+                const response = await fetch(`${api.defaults.baseURL}/api/generate/stream`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+                    credentials: 'include',
+                    body: JSON.stringify({
+                        topic: currentInput,
+                        content_type: currentType,
+                        user_id: user.id || user.email,
+                        mode: aiMode
+                    })
                 });
 
-                if (response.data.content) {
-                    const aiMsgId = Date.now() + 1;
-                    const aiMsg = {
-                        id: aiMsgId,
-                        type: 'ai',
-                        content: response.data.content,
-                        contentType: currentType,
-                        topic: currentInput
-                    };
-                    setChatMessages(prev => [...prev, aiMsg]);
-
-                    // Start Typing Effect
-                    setTypingId(aiMsgId);
-                    let fullText = response.data.content;
-                    let currentText = "";
-                    let index = 0;
+                if (!response.ok || !response.body) {
+                    const errorData = await response.json().catch(() => ({}));
+                    throw { response: { data: errorData } };
+                }
 
-                    const typeInterval = setInterval(() => {
-                        if (index < fullText.length) {
-                            currentText += fullText[index];
-                            setDisplayContent(prev => ({ ...prev, [aiMsgId]: currentText }));
-                            index++;
-                        } else {
-                            clearInterval(typeInterval);
-                            setTypingId(null);
+                const aiMsgId = Date.now() + 1;
+                setChatMessages(prev => [...prev, {
+                    id: aiMsgId,
+                    type: 'ai',
+                    content: '',
+                    contentType: currentType,
+                    topic: currentInput
+                }]);
+                setTypingId(aiMsgId);
+
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = "";
+                let fullText = "";
+
+                try {
+                    while (true) {
+                        const { value, done } = await reader.read();
+                        if (done) break;
+                        buffer += decoder.decode(value, { stream: true });
+
+                        // SSE messages are separated by a blank line
+                        const events = buffer.split("\n\n");
+                        buffer = events.pop();
+                        for (const evt of events) {
+                            if (!evt.startsWith("data: ")) continue;
+                            const payload = JSON.parse(evt.slice(6));
+                            if (payload.error) throw { response: { data: payload } };
+                            if (payload.delta) {
+                                fullText += payload.delta;
+                                setDisplayContent(prev => ({ ...prev, [aiMsgId]: fullText }));
+                            }
                         }
-                    }, 5); // Fast typing speed
-
-                    fetchHistory(); // Refresh history
+                    }
+                } finally {
+                    setTypingId(null);
+                    setChatMessages(prev => prev.map(m => m.id === aiMsgId ? { ...m, content: fullText } : m));
                 }
+
+                fetchHistory(); // Refresh history
             }
 
         } catch (error) {
@@ -373,7 +379,7 @@ const Dashboard = ({ user, onLogout }) => {
         pdfInputRef.current?.click();
     };
 
-    const handlePdfFileSelect = (e) => {
+    const handlePdfFileSelect = async (e) => {
         const file = e.target.files?.[0];
         if (file) {
             // Store selected PDF in state for display
@@ -387,6 +393,19 @@ const Dashboard = ({ user, onLogout }) => {
             if (pdfInputRef.current) {
                 pdfInputRef.current.value = '';
             }
+
+            // Upload once - later questions only send the document id
+            try {
+                const formData = new FormData();
+                formData.append('file', file);
+                formData.append('user_id', user.id || user.email);
+                const response = await api.post('/api/pdf/upload', formData, {
+                    headers: { 'Content-Type': 'multipart/form-data' }
+                });
+                setSelectedPdfForChat(prev => prev && prev.file === file ? { ...prev, docId: response.data.doc_id } : prev);
+            } catch (error) {
+                console.error('Error uploading PDF:', error);
+            }
         }
     };
 
@@ -617,7 +636,7 @@ const Dashboard = ({ user, onLogout }) => {
                                     <div className="admin-stats-container">
                                         <div className="admin-header">
                                             <h3 className="admin-stats-title">Daily User Logins</h3>
-                                            <button onClick={fetchAdminStats} className="refresh-btn">🔄 Refresh</button>
+                                            <button onClick={() => fetchAdminStats(true)} className="refresh-btn">🔄 Refresh</button>
                                         </div>
                                         {adminStats?.daily && adminStats.daily.length > 0 ? (
                                             <div className="admin-stats-list">
@@ -659,7 +678,7 @@ const Dashboard = ({ user, onLogout }) => {
                                                 </button>
                                             ))}
                                         </div>
-                                        <button onClick={fetchAdminStats} className="refresh-btn-glow">
+                                        <button onClick={() => fetchAdminStats(true)} className="refresh-btn-glow">
                                             <ActivityIcon size={16} /> Refresh
                                         </button>
                                     </div>